@@ -4,6 +4,11 @@ import json
 from typing import Optional
 import sys
 
+from webhook_server.cache import TTLCache
+from webhook_server.config import LETTA_HEADERS, PROTECTED_TOOLS
+from webhook_server.http_client import build_session
+from webhook_server.json_utils import response_json
+
 # Environment configuration
 LETTA_URL = os.environ.get('LETTA_API_URL', 'http://192.168.50.90:8289/v1')
 # Ensure it's always HTTPS
@@ -12,7 +17,18 @@ if LETTA_URL.startswith('http://'):
 if not LETTA_URL.endswith('/v1'):
     LETTA_URL = LETTA_URL.rstrip('/') + '/v1'
 
-LETTA_API_KEY = os.environ.get('LETTA_PASSWORD')
+# Shared keep-alive session for tool lookups; attach PATCHes are idempotent (409 if present)
+letta_tools_session = build_session(
+    retries=2,
+    backoff_factor=0.25,
+    headers=LETTA_HEADERS,
+    allowed_methods=("GET", "PATCH"),
+)
+
+# Resolved find_tools IDs per agent. The lookup walks agent tools, all tools and MCP
+# servers (up to N+3 GETs) on every webhook, but the answer changes very rarely.
+FIND_TOOLS_ID_CACHE_TTL = 300
+_find_tools_id_cache = TTLCache(maxsize=512, ttl=FIND_TOOLS_ID_CACHE_TTL)
 
 def get_find_tools_id(agent_id: Optional[str] = None) -> Optional[str]:
     """
@@ -26,15 +42,6 @@ def get_find_tools_id(agent_id: Optional[str] = None) -> Optional[str]:
     Returns:
         str: The tool ID for find_tools, or None if not found
     """
-    # Prepare headers
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    
-    if LETTA_API_KEY:
-        headers["Authorization"] = f"Bearer {LETTA_API_KEY}"
-    
     try:
         # If agent_id is provided, check agent's tools first
         if agent_id:
@@ -42,9 +49,9 @@ def get_find_tools_id(agent_id: Optional[str] = None) -> Optional[str]:
             print(f"[TOOL_LOOKUP] Checking agent {agent_id} tools: {agent_tools_url}", file=sys.stderr)
             
             try:
-                agent_response = requests.get(agent_tools_url, headers=headers, timeout=10)
+                agent_response = letta_tools_session.get(agent_tools_url, timeout=10)
                 if agent_response.status_code == 200:
-                    agent_tools = agent_response.json()
+                    agent_tools = response_json(agent_response)
                     
                     # Look for find_tools in agent's tools
                     for tool in agent_tools:
@@ -71,10 +78,10 @@ def get_find_tools_id(agent_id: Optional[str] = None) -> Optional[str]:
         # Fall back to checking all tools
         url = f"{LETTA_URL}/tools"
         print(f"[TOOL_LOOKUP] Querying all tools: {url}", file=sys.stderr)
-        response = requests.get(url, headers=headers, timeout=10)
+        response = letta_tools_session.get(url, timeout=10)
         
         if response.status_code == 200:
-            tools = response.json()
+            tools = response_json(response)
             
             # Search for find_tools by name
             for tool in tools:
@@ -88,10 +95,10 @@ def get_find_tools_id(agent_id: Optional[str] = None) -> Optional[str]:
         # Now try MCP servers
         mcp_url = f"{LETTA_URL}/tools/mcp/servers"
         print(f"[TOOL_LOOKUP] Querying MCP servers: {mcp_url}", file=sys.stderr)
-        mcp_response = requests.get(mcp_url, headers=headers, timeout=10)
+        mcp_response = letta_tools_session.get(mcp_url, timeout=10)
         
         if mcp_response.status_code == 200:
-            mcp_servers = mcp_response.json()
+            mcp_servers = response_json(mcp_response)
             
             # Check each MCP server for find_tools
             for server_name, server_info in mcp_servers.items():
@@ -100,9 +107,9 @@ def get_find_tools_id(agent_id: Optional[str] = None) -> Optional[str]:
                 # Get tools from this MCP server
                 server_tools_url = f"{LETTA_URL}/tools/mcp/servers/{server_name}/tools"
                 try:
-                    tools_response = requests.get(server_tools_url, headers=headers, timeout=10)
+                    tools_response = letta_tools_session.get(server_tools_url, timeout=10)
                     if tools_response.status_code == 200:
-                        server_tools = tools_response.json()
+                        server_tools = response_json(tools_response)
                         
                         for tool in server_tools:
                             tool_name = tool.get('name', '').lower()
@@ -142,7 +149,13 @@ def get_find_tools_id_with_fallback(agent_id: Optional[str] = None, fallback_id:
         # These are the known tool IDs from the conversation history
         fallback_id = "tool-e34b5c60-5bd5-4288-a97f-2167ddf3062b"  # Original ID
         
-    dynamic_id = get_find_tools_id(agent_id)
+    # Only successful lookups are cached so a transient miss is retried next webhook
+    cache_key = agent_id or ""
+    dynamic_id = _find_tools_id_cache.get(cache_key)
+    if dynamic_id is None:
+        dynamic_id = get_find_tools_id(agent_id)
+        if dynamic_id:
+            _find_tools_id_cache.set(cache_key, dynamic_id)
     if dynamic_id:
         return dynamic_id
     else:
@@ -160,20 +173,12 @@ def get_tool_id_by_name(tool_name: str) -> Optional[str]:
     Returns:
         str: The tool ID if found, None otherwise
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    
-    if LETTA_API_KEY:
-        headers["Authorization"] = f"Bearer {LETTA_API_KEY}"
-    
     try:
         url = f"{LETTA_URL}/tools"
-        response = requests.get(url, headers=headers, timeout=10)
+        response = letta_tools_session.get(url, timeout=10)
         
         if response.status_code == 200:
-            tools = response.json()
+            tools = response_json(response)
             
             for tool in tools:
                 if tool.get('name', '').lower() == tool_name.lower():
@@ -196,20 +201,12 @@ def get_agent_tool_names(agent_id: str) -> set:
     Returns:
         set: Set of tool names (lowercase) attached to the agent
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    
-    if LETTA_API_KEY:
-        headers["Authorization"] = f"Bearer {LETTA_API_KEY}"
-    
     try:
         url = f"{LETTA_URL}/agents/{agent_id}/tools"
-        response = requests.get(url, headers=headers, timeout=10)
+        response = letta_tools_session.get(url, timeout=10)
         
         if response.status_code == 200:
-            tools = response.json()
+            tools = response_json(response)
             return {tool.get('name', '').lower() for tool in tools if tool.get('name')}
         
         return set()
@@ -230,19 +227,11 @@ def attach_tool_to_agent(agent_id: str, tool_id: str) -> bool:
     Returns:
         bool: True if successful, False otherwise
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    
-    if LETTA_API_KEY:
-        headers["Authorization"] = f"Bearer {LETTA_API_KEY}"
-    
     try:
         url = f"{LETTA_URL}/agents/{agent_id}/tools/attach/{tool_id}"
         print(f"[PROTECTED_TOOLS] Attaching tool {tool_id} to agent {agent_id}", file=sys.stderr)
         
-        response = requests.patch(url, headers=headers, json={}, timeout=10)
+        response = letta_tools_session.patch(url, json={}, timeout=10)
         
         if response.status_code in [200, 201]:
             print(f"[PROTECTED_TOOLS] Successfully attached tool {tool_id}", file=sys.stderr)
@@ -281,7 +270,6 @@ def ensure_protected_tools(agent_id: str, protected_tools_config: str = None) ->
     
     # Get protected tools from config if not provided
     if protected_tools_config is None:
-        from webhook_server.config import PROTECTED_TOOLS
         protected_tools_config = PROTECTED_TOOLS
     
     # Parse protected tool names
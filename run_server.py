@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Now import and run the app
 from webhook_server.app import app
+from webhook_server.logging_config import configure_logging
 import argparse
 
 if __name__ == "__main__":
@@ -18,5 +19,6 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=5005, help="Port to listen on")
     args = parser.parse_args()
     
+    configure_logging()
     print(f"Starting webhook server on {args.host}:{args.port}")
     app.run(host=args.host, port=args.port, debug=False)
\ No newline at end of file
@@ -424,6 +424,23 @@ def reset_agent_tracking():
     known_agents.clear()
 
 
+@pytest.fixture(autouse=True)
+def reset_lookup_caches():
+    """Clear cached Letta lookups so tests never see each other's responses."""
+    from webhook_server.block_finders import (
+        _attached_blocks_cache,
+        _attached_labels_cache,
+        _global_blocks_cache,
+    )
+    from letta_tool_utils import _find_tools_id_cache
+    caches = (_global_blocks_cache, _attached_blocks_cache, _attached_labels_cache, _find_tools_id_cache)
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def cleanup_environment():
     """Cleanup environment after each test."""
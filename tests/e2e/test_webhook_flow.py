@@ -162,8 +162,9 @@ class TestWebhookPerformance:
 class TestAgentTrackingFlow:
     """E2E tests for agent tracking and notifications."""
 
-    @patch('webhook_server.app.requests.post')
-    def test_new_agent_triggers_notification(self, mock_post, client, reset_agent_tracking):
+    @patch('webhook_server.app.register_agent', return_value=True)
+    @patch('webhook_server.app.matrix_session.post')
+    def test_new_agent_triggers_notification(self, mock_post, mock_register, client, reset_agent_tracking):
         """Test that detecting a new agent triggers Matrix notification."""
         # Mock Matrix client response
         mock_response = Mock()
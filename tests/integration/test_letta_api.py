@@ -173,10 +173,9 @@ class TestLettaMemoryBlockCRUD:
             status=200
         )
 
-        with patch('webhook_server.block_finders.get_api_url', side_effect=[
-            "http://test-letta.example.com/v1/agents/agent-123/core-memory/blocks",
-            "http://test-letta.example.com/v1/blocks"
-        ]):
+        # Both lookups run concurrently, so resolve URLs by path rather than call order
+        with patch('webhook_server.block_finders.get_api_url',
+                   side_effect=lambda path: f"http://test-letta.example.com/v1/{path}"):
             block, is_attached = find_memory_block("agent-123", "cumulative_context")
 
         assert block is not None
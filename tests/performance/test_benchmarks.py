@@ -109,7 +109,7 @@ class TestMemoryOperationsPerformance:
     """Performance tests for memory operations."""
 
     @pytest.mark.benchmark
-    @patch('webhook_server.memory_manager.requests.post')
+    @patch('webhook_server.memory_manager.letta_session.post')
     @patch('webhook_server.memory_manager.find_memory_block')
     def test_create_memory_block_performance(self, mock_find, mock_post, benchmark):
         """Test memory block creation performance."""
@@ -133,7 +133,7 @@ class TestToolManagerPerformance:
     """Performance tests for tool management."""
 
     @pytest.mark.benchmark
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_performance(self, mock_get, benchmark):
         """Test that fetching agent tools is fast."""
         import tool_manager
@@ -6,7 +6,11 @@ Tests Flask webhook endpoints, agent tracking, and webhook processing logic.
 
 import pytest
 import json
-from unittest.mock import Mock, patch, MagicMock
+import logging
+import requests
+import threading
+import time
+from unittest.mock import Mock, patch
 from datetime import datetime, UTC
 
 # These tests use the Flask test client fixture from conftest.py
@@ -137,8 +141,9 @@ class TestTrackAgentAndNotify:
         track_agent_and_notify("invalid-123")
         assert len(known_agents) == 0
 
-    @patch('webhook_server.app.requests.post')
-    def test_track_agent_adds_new_agent(self, mock_post, reset_agent_tracking):
+    @patch('webhook_server.app.register_agent', return_value=True)
+    @patch('webhook_server.app.matrix_session.post')
+    def test_track_agent_adds_new_agent(self, mock_post, mock_register, reset_agent_tracking):
         """Test that new agent is tracked and notification is sent."""
         from webhook_server.app import track_agent_and_notify, known_agents
 
@@ -152,8 +157,9 @@ class TestTrackAgentAndNotify:
         # Agent should be added to known_agents
         assert "agent-123" in known_agents
 
-    @patch('webhook_server.app.requests.post')
-    def test_track_agent_does_not_notify_twice(self, mock_post, reset_agent_tracking):
+    @patch('webhook_server.app.register_agent', return_value=True)
+    @patch('webhook_server.app.matrix_session.post')
+    def test_track_agent_does_not_notify_twice(self, mock_post, mock_register, reset_agent_tracking):
         """Test that second tracking of same agent doesn't send notification."""
         from webhook_server.app import track_agent_and_notify
 
@@ -173,8 +179,9 @@ class TestTrackAgentAndNotify:
         # First call should have happened
         assert mock_post.called
 
-    @patch('webhook_server.app.requests.post')
-    def test_track_agent_handles_notification_failure(self, mock_post, reset_agent_tracking):
+    @patch('webhook_server.app.register_agent', return_value=True)
+    @patch('webhook_server.app.matrix_session.post')
+    def test_track_agent_handles_notification_failure(self, mock_post, mock_register, reset_agent_tracking):
         """Test that notification failure doesn't prevent agent tracking."""
         from webhook_server.app import track_agent_and_notify, known_agents
 
@@ -189,16 +196,38 @@ class TestTrackAgentAndNotify:
         assert "agent-789" in known_agents
 
 
+    @patch('webhook_server.app.MAX_KNOWN_AGENTS', 2)
+    @patch('webhook_server.app._notify_pool')
+    def test_track_agent_evicts_least_recently_seen(self, mock_pool, reset_agent_tracking):
+        """Test that known_agents stays bounded, evicting the least recently seen agent."""
+        from webhook_server.app import track_agent_and_notify, known_agents
+
+        track_agent_and_notify("agent-a")
+        track_agent_and_notify("agent-b")
+        track_agent_and_notify("agent-a")  # refresh "agent-a"
+        track_agent_and_notify("agent-c")
+
+        assert list(known_agents) == ["agent-a", "agent-c"]
+
+    @patch('webhook_server.app._notify_pool')
+    def test_track_agent_submits_notification_to_shared_pool(self, mock_pool, reset_agent_tracking):
+        """Test that a new agent's notification runs on the shared pool, once."""
+        from webhook_server.app import track_agent_and_notify
+
+        track_agent_and_notify("agent-pool-1")
+        track_agent_and_notify("agent-pool-1")
+
+        mock_pool.submit.assert_called_once()
+
+
 class TestQueryGraphitiAPI:
     """Tests for query_graphiti_api function."""
 
-    @patch('webhook_server.app.requests.Session')
-    def test_query_graphiti_success(self, mock_session_class):
+    @patch('webhook_server.app.graphiti_session')
+    def test_query_graphiti_success(self, mock_session):
         """Test successful Graphiti query with unified search endpoint."""
         from webhook_server.app import query_graphiti_api
 
-        mock_session = MagicMock()
-        mock_session_class.return_value = mock_session
 
         # Mock unified search response with both nodes and edges (facts)
         mock_response = Mock()
@@ -222,13 +251,11 @@ class TestQueryGraphitiAPI:
         assert "Test Node" in result['context']
         assert "Test fact" in result['context']
 
-    @patch('webhook_server.app.requests.Session')
-    def test_query_graphiti_no_results(self, mock_session_class):
+    @patch('webhook_server.app.graphiti_session')
+    def test_query_graphiti_no_results(self, mock_session):
         """Test Graphiti query with no results."""
         from webhook_server.app import query_graphiti_api
 
-        mock_session = MagicMock()
-        mock_session_class.return_value = mock_session
 
         # Mock empty unified response
         mock_response = Mock()
@@ -243,14 +270,12 @@ class TestQueryGraphitiAPI:
         assert result['success'] is False
         assert "No relevant information found" in result['context']
 
-    @patch('webhook_server.app.requests.Session')
-    def test_query_graphiti_handles_request_exception(self, mock_session_class):
+    @patch('webhook_server.app.graphiti_session')
+    def test_query_graphiti_handles_request_exception(self, mock_session):
         """Test handling of request exceptions."""
         from webhook_server.app import query_graphiti_api
         import requests
 
-        mock_session = MagicMock()
-        mock_session_class.return_value = mock_session
         mock_session.post.side_effect = requests.exceptions.RequestException("Network error")
 
         result = query_graphiti_api("test query")
@@ -258,13 +283,11 @@ class TestQueryGraphitiAPI:
         assert result['success'] is False
         assert "Error querying Graphiti" in result['context']
 
-    @patch('webhook_server.app.requests.Session')
-    def test_query_graphiti_uses_custom_limits(self, mock_session_class):
+    @patch('webhook_server.app.graphiti_session')
+    def test_query_graphiti_uses_custom_limits(self, mock_session):
         """Test that custom max_nodes limit is used in unified config."""
         from webhook_server.app import query_graphiti_api
 
-        mock_session = MagicMock()
-        mock_session_class.return_value = mock_session
 
         mock_response = Mock()
         mock_response.status_code = 200
@@ -281,13 +304,11 @@ class TestQueryGraphitiAPI:
         # Unified API uses config.limit for max results
         assert search_call[1]['json']['config']['limit'] == 15
 
-    @patch('webhook_server.app.requests.Session')
-    def test_query_graphiti_deduplicates_facts(self, mock_session_class):
+    @patch('webhook_server.app.graphiti_session')
+    def test_query_graphiti_deduplicates_facts(self, mock_session):
         """Test that duplicate facts (edges) are deduplicated."""
         from webhook_server.app import query_graphiti_api
 
-        mock_session = MagicMock()
-        mock_session_class.return_value = mock_session
 
         # Return duplicate edges in unified response
         mock_response = Mock()
@@ -311,6 +332,84 @@ class TestQueryGraphitiAPI:
         assert result['context'].count("Unique fact") == 1
 
 
+class TestGraphitiConcurrentSearch:
+    """Tests for the concurrent facts/nodes searches in query_graphiti_api."""
+
+    @patch('webhook_server.app.graphiti_session')
+    def test_facts_and_nodes_results_are_combined(self, mock_session):
+        """Test that both searches are issued and their results merged."""
+        from webhook_server.app import query_graphiti_api
+
+        def post(url, json=None, timeout=None):
+            response = Mock()
+            response.raise_for_status = Mock()
+            if url.endswith("/search/nodes"):
+                response.json.return_value = {"nodes": [{"name": "Node A", "summary": "about A", "score": 1}]}
+            else:
+                response.json.return_value = {"facts": [{"fact": "A relates to B", "score": 1}]}
+            return response
+
+        mock_session.post.side_effect = post
+
+        result = query_graphiti_api("test query")
+
+        assert result['success'] is True
+        assert "Node A" in result['context']
+        assert "A relates to B" in result['context']
+        posted = sorted(c.args[0].rsplit("/", 1)[-1] for c in mock_session.post.call_args_list)
+        assert posted == ["nodes", "search"]
+
+    @patch('webhook_server.app.graphiti_session')
+    def test_failed_facts_search_keeps_nodes(self, mock_session):
+        """Test that a failing facts search does not discard node results."""
+        from webhook_server.app import query_graphiti_api
+
+        def post(url, json=None, timeout=None):
+            if not url.endswith("/search/nodes"):
+                raise requests.exceptions.ConnectionError("facts down")
+            response = Mock()
+            response.raise_for_status = Mock()
+            response.json.return_value = {"nodes": [{"name": "Node A", "summary": "about A", "score": 1}]}
+            return response
+
+        mock_session.post.side_effect = post
+
+        result = query_graphiti_api("test query")
+
+        assert result['success'] is True
+        assert "Node A" in result['context']
+
+
+class TestGraphitiContextFormatting:
+    """Tests for how query_graphiti_api formats search results."""
+
+    @patch('webhook_server.app.graphiti_session')
+    def test_facts_are_deduplicated_in_first_seen_order(self, mock_session):
+        """Test that repeated and unnamed facts are dropped while order is kept."""
+        from webhook_server.app import query_graphiti_api
+
+        def post(url, json=None, timeout=None):
+            response = Mock()
+            response.raise_for_status = Mock()
+            if url.endswith("/search/nodes"):
+                response.json.return_value = {"nodes": []}
+            else:
+                response.json.return_value = {"facts": [
+                    {"fact": "Second", "score": 1},
+                    {"fact": "First", "score": 1},
+                    {"fact": "Second", "score": 1},
+                    {"score": 1},
+                ]}
+            return response
+
+        mock_session.post.side_effect = post
+
+        result = query_graphiti_api("test query")
+
+        assert result['context'].endswith("Fact: Second\n\nFact: First")
+        assert "N/A" not in result['context']
+
+
 class TestWebhookEndpoint:
     """Tests for the main webhook endpoint."""
 
@@ -335,6 +434,129 @@ class TestWebhookEndpoint:
         pass
 
 
+class TestWebhookAgentIdFromPath:
+    """Tests for extracting the agent ID from the request path of a webhook."""
+
+    @pytest.mark.parametrize("path,expected", [
+        ("/v1/agents/agent-abc123/messages", "agent-abc123"),
+        ("/v1/agents/agent-abc123", "agent-abc123"),
+        ("/v1/agents/not-an-agent/messages", None),
+        ("/v1/agents/", None),
+        ("/v1/blocks/agent-abc123", None),
+    ])
+    def test_agent_id_is_taken_from_agents_segment(self, client, path, expected):
+        """Test that only an agent- ID directly after /agents/ is used."""
+        payload = {"type": "message_sent", "request": {"path": path}}
+
+        with patch('webhook_server.app.track_agent_and_notify') as mock_track:
+            response = client.post('/webhook', json=payload)
+
+        assert response.status_code == 400
+        if expected:
+            mock_track.assert_called_once_with(expected)
+        else:
+            mock_track.assert_not_called()
+
+
+class TestWebhookBodyParsing:
+    """Tests for how the webhook endpoint reads its request body."""
+
+    @pytest.mark.parametrize("kwargs", [
+        {"data": "not json", "content_type": "text/plain"},
+        {"data": "{broken", "content_type": "application/json"},
+        {"json": ["a", "list"]},
+    ])
+    def test_non_object_body_returns_400(self, client, kwargs):
+        """Test that bodies that are not a JSON object are rejected with 400, not 500."""
+        response = client.post('/webhook', **kwargs)
+
+        assert response.status_code == 400
+        assert "JSON object" in response.get_json()["error"]
+
+
+class TestWebhookPayloadLogging:
+    """Tests for the debug dump of incoming webhook payloads."""
+
+    def test_payload_is_not_serialized_above_debug(self, client):
+        """Test that the pretty-printed payload is only built when DEBUG logging is enabled."""
+        with patch('webhook_server.app.dumps_pretty') as mock_dumps, \
+                patch.object(logging.getLogger('webhook_server.app'), 'isEnabledFor', return_value=False):
+            response = client.post('/webhook', json={"type": "unknown_event"})
+
+        assert response.status_code == 400
+        mock_dumps.assert_not_called()
+
+    def test_payload_is_serialized_at_debug(self, client):
+        """Test that the payload is dumped when DEBUG logging is enabled."""
+        with patch('webhook_server.app.dumps_pretty', return_value="{}") as mock_dumps, \
+                patch.object(logging.getLogger('webhook_server.app'), 'isEnabledFor', return_value=True):
+            client.post('/webhook', json={"type": "unknown_event"})
+
+        mock_dumps.assert_called_once_with({"type": "unknown_event"})
+
+
+class TestWebhookStages:
+    """Tests for running the independent webhook stages concurrently."""
+
+    PAYLOAD = {
+        "type": "message_sent",
+        "prompt": "Find me recent papers on graph neural networks",
+        "response": {"agent_id": "agent-stages-123"},
+    }
+
+    def test_tool_attachment_overlaps_context_generation(self, client):
+        """Test that tool attachment runs while context generation is still in progress."""
+        tools_started = threading.Event()
+
+        def slow_context(*args, **kwargs):
+            # Only returns once tool attachment has started on the stage pool
+            assert tools_started.wait(timeout=5)
+            return {"context": "ctx", "success": True}
+
+        def attach(*args, **kwargs):
+            tools_started.set()
+            return {"success": True}
+
+        with patch('webhook_server.app.track_agent_and_notify'), \
+                patch('webhook_server.app.generate_context_from_prompt', side_effect=slow_context), \
+                patch('webhook_server.app.create_memory_block') as mock_create, \
+                patch('webhook_server.app.update_available_agents_block') as mock_agents, \
+                patch('webhook_server.app.attach_relevant_tools', side_effect=attach) as mock_attach:
+            response = client.post('/webhook', json=self.PAYLOAD)
+
+        assert response.status_code == 200
+        mock_create.assert_called_once()
+        mock_agents.assert_called_once()
+        mock_attach.assert_called_once()
+
+    def test_stages_are_joined_when_context_generation_fails(self, client):
+        """Test that a failing context stage still waits for the background stages before responding."""
+        finished = []
+
+        def slow_attach(*args, **kwargs):
+            time.sleep(0.05)
+            finished.append("tools")
+
+        with patch('webhook_server.app.track_agent_and_notify'), \
+                patch('webhook_server.app.generate_context_from_prompt', side_effect=RuntimeError("graphiti down")), \
+                patch('webhook_server.app.update_available_agents_block'), \
+                patch('webhook_server.app.attach_relevant_tools', side_effect=slow_attach):
+            response = client.post('/webhook', json=self.PAYLOAD)
+
+        assert response.status_code == 500
+        assert finished == ["tools"]
+
+    def test_stage_failures_do_not_fail_webhook(self, client):
+        """Test that agent discovery and tool attachment errors are contained."""
+        with patch('webhook_server.app.track_agent_and_notify'), \
+                patch('webhook_server.app.generate_context_from_prompt', return_value={"success": False}), \
+                patch('webhook_server.app.query_agent_registry', side_effect=RuntimeError("registry down")), \
+                patch('webhook_server.app.get_find_tools_id_with_fallback', side_effect=RuntimeError("letta down")):
+            response = client.post('/webhook', json=self.PAYLOAD)
+
+        assert response.status_code == 200
+
+
 class TestAgentDiscoveryBlockLabels:
     """Tests for agent discovery block label uniqueness."""
 
@@ -359,6 +581,85 @@ class TestAgentDiscoveryBlockLabels:
         assert label_2 == "available_agents_agent-bbb"
 
 
+class TestExtractUserIntent:
+    """Tests for prompt wrapper stripping."""
+
+    @pytest.mark.parametrize("prompt,expected", [
+        ("plain question about deployments", "plain question about deployments"),
+        ("[Matrix: @user:example.org in Ops] restart the worker", "restart the worker"),
+        ("[MESSAGE FROM OPENCODE USER] run the tests", "run the tests"),
+        ("check logs <system-reminder>ignore me</system-reminder> now", "check logs  now"),
+        ("summarize this\n--- RESPONSE INSTRUCTION ---\nbe brief", "summarize this"),
+        ("<context>meta</context>what changed?", "what changed?"),
+        ("a < b and c > d", "a < b and c > d"),
+    ])
+    def test_strips_wrappers(self, prompt, expected):
+        """Test that metadata wrappers are removed and plain text is preserved."""
+        from webhook_server.app import extract_user_intent
+
+        assert extract_user_intent(prompt) == expected
+
+    def test_repeated_prompt_is_served_from_cache(self):
+        """Test that a repeated prompt reuses the cached cleanup."""
+        from webhook_server.app import extract_user_intent
+
+        prompt = "[Matrix: @user:example.org in Room] deploy the cached service"
+        first = extract_user_intent(prompt)
+        hits = extract_user_intent.cache_info().hits
+        second = extract_user_intent(prompt)
+
+        assert second == first == "deploy the cached service"
+        assert extract_user_intent.cache_info().hits == hits + 1
+
+
+class TestExtractTextFromContent:
+    """Tests for extract_text_from_content function."""
+
+    @pytest.mark.parametrize("content,expected", [
+        ("plain prompt", "plain prompt"),
+        (None, None),
+        ([{"type": "text", "text": "first"}, {"type": "text", "text": "second"}], "first second"),
+        ([{"type": "image", "url": "x"}, {"type": "text", "text": " only text "}], "only text"),
+        ([{"type": "text"}, "stray", {"type": "text", "text": "kept"}], "kept"),
+        ([], ""),
+    ])
+    def test_flattens_text_parts(self, content, expected):
+        """Test that text parts are joined and non-list content passes through."""
+        from webhook_server.app import extract_text_from_content
+
+        assert extract_text_from_content(content) == expected
+
+
+class TestShouldSkipToolAttachment:
+    """Tests for trivial-message detection."""
+
+    @pytest.mark.parametrize("prompt", [
+        "",
+        "hi",
+        "thanks a lot for that",
+        "Hello there, how are things",
+        "how are you?",
+        "!!! ??? ... ,,, ;;;",
+        "[Matrix: @user:example.org in Room] ok",
+    ])
+    def test_trivial_messages_are_skipped(self, prompt):
+        """Test that greetings, small talk and punctuation are skipped."""
+        from webhook_server.app import should_skip_tool_attachment
+
+        assert should_skip_tool_attachment(prompt) is True
+
+    @pytest.mark.parametrize("prompt", [
+        "please find the deployment file for me",
+        "okayish, this is a longer question",
+        "how's it going?? with the migration plan",
+    ])
+    def test_substantive_messages_are_not_skipped(self, prompt):
+        """Test that real requests are not treated as trivial."""
+        from webhook_server.app import should_skip_tool_attachment
+
+        assert should_skip_tool_attachment(prompt) is False
+
+
 class TestProtectedToolsConfig:
     """Tests for protected tools configuration."""
 
@@ -483,10 +784,37 @@ class TestEnsureProtectedTools:
         assert len(result["attached"]) == 2  # find_tools and search
 
 
+class TestGetFindToolsIdWithFallback:
+    """Tests for get_find_tools_id_with_fallback function."""
+
+    @patch('letta_tool_utils.get_find_tools_id')
+    def test_caches_resolved_id_per_agent(self, mock_lookup):
+        """Test that a resolved find_tools ID is reused for the same agent."""
+        from letta_tool_utils import get_find_tools_id_with_fallback
+
+        mock_lookup.return_value = "tool-find-1"
+
+        assert get_find_tools_id_with_fallback(agent_id="agent-1") == "tool-find-1"
+        assert get_find_tools_id_with_fallback(agent_id="agent-1") == "tool-find-1"
+
+        mock_lookup.assert_called_once_with("agent-1")
+
+    @patch('letta_tool_utils.get_find_tools_id')
+    def test_fallback_is_not_cached(self, mock_lookup):
+        """Test that a failed lookup returns the fallback and is retried next time."""
+        from letta_tool_utils import get_find_tools_id_with_fallback
+
+        mock_lookup.side_effect = [None, "tool-find-1"]
+
+        assert get_find_tools_id_with_fallback(agent_id="agent-1", fallback_id="tool-fallback") == "tool-fallback"
+        assert get_find_tools_id_with_fallback(agent_id="agent-1", fallback_id="tool-fallback") == "tool-find-1"
+        assert mock_lookup.call_count == 2
+
+
 class TestGetToolIdByName:
     """Tests for get_tool_id_by_name function."""
 
-    @patch('letta_tool_utils.requests.get')
+    @patch('letta_tool_utils.letta_tools_session.get')
     def test_get_tool_id_by_name_success(self, mock_get):
         """Test successful tool ID lookup by name."""
         from letta_tool_utils import get_tool_id_by_name
@@ -503,7 +831,7 @@ class TestGetToolIdByName:
         
         assert result == "tool-123"
 
-    @patch('letta_tool_utils.requests.get')
+    @patch('letta_tool_utils.letta_tools_session.get')
     def test_get_tool_id_by_name_not_found(self, mock_get):
         """Test tool ID lookup when tool not found."""
         from letta_tool_utils import get_tool_id_by_name
@@ -519,7 +847,7 @@ class TestGetToolIdByName:
         
         assert result is None
 
-    @patch('letta_tool_utils.requests.get')
+    @patch('letta_tool_utils.letta_tools_session.get')
     def test_get_tool_id_by_name_case_insensitive(self, mock_get):
         """Test that tool lookup is case insensitive."""
         from letta_tool_utils import get_tool_id_by_name
@@ -539,7 +867,7 @@ class TestGetToolIdByName:
 class TestAttachToolToAgent:
     """Tests for attach_tool_to_agent function."""
 
-    @patch('letta_tool_utils.requests.patch')
+    @patch('letta_tool_utils.letta_tools_session.patch')
     def test_attach_tool_success(self, mock_patch):
         """Test successful tool attachment."""
         from letta_tool_utils import attach_tool_to_agent
@@ -553,7 +881,7 @@ class TestAttachToolToAgent:
         assert result is True
         mock_patch.assert_called_once()
 
-    @patch('letta_tool_utils.requests.patch')
+    @patch('letta_tool_utils.letta_tools_session.patch')
     def test_attach_tool_already_attached(self, mock_patch):
         """Test when tool is already attached (409 conflict)."""
         from letta_tool_utils import attach_tool_to_agent
@@ -567,7 +895,7 @@ class TestAttachToolToAgent:
         # Should return True since tool is effectively attached
         assert result is True
 
-    @patch('letta_tool_utils.requests.patch')
+    @patch('letta_tool_utils.letta_tools_session.patch')
     def test_attach_tool_failure(self, mock_patch):
         """Test handling of attachment failure."""
         from letta_tool_utils import attach_tool_to_agent
@@ -8,13 +8,37 @@ import pytest
 from unittest.mock import Mock, patch
 import requests
 
-from webhook_server.block_finders import find_memory_block
+from webhook_server.http_client import LETTA_TIMEOUT
+from webhook_server.block_finders import (
+    _attached_blocks_cache,
+    find_memory_block,
+    invalidate_global_blocks,
+)
+
+
+def route_by_stage(agent_response, global_response, blocks_by_id=None):
+    """Build a letta_session.get side effect that answers each lookup stage.
+
+    The two stages run concurrently, so responses are dispatched on the
+    presence of query params (only the global lookup sends them) rather
+    than on call order. Single-block reads (blocks/{id}) are answered with
+    the matching entry of blocks_by_id.
+    """
+    def _get(url, **kwargs):
+        if "params" in kwargs:
+            return global_response
+        if url.endswith("/core-memory/blocks"):
+            return agent_response
+        block_response = Mock()
+        block_response.json.return_value = blocks_by_id[url.rsplit("/", 1)[-1]]
+        return block_response
+    return _get
 
 
 class TestFindMemoryBlock:
     """Tests for find_memory_block function."""
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_attached_block(self, mock_get):
         """Test finding a block that is attached to the agent."""
         # Mock response for agent blocks endpoint
@@ -32,9 +56,8 @@ class TestFindMemoryBlock:
         assert block["id"] == "block-123"
         assert block["label"] == "cumulative_context"
         assert is_attached is True
-        mock_get.assert_called_once()
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_global_block_not_attached(self, mock_get):
         """Test finding a global block that is not attached to the agent."""
         # First call: agent blocks (empty)
@@ -49,7 +72,7 @@ class TestFindMemoryBlock:
         ]
         mock_global_response.raise_for_status = Mock()
 
-        mock_get.side_effect = [mock_agent_response, mock_global_response]
+        mock_get.side_effect = route_by_stage(mock_agent_response, mock_global_response)
 
         block, is_attached = find_memory_block("agent-789", "cumulative_context")
 
@@ -58,7 +81,7 @@ class TestFindMemoryBlock:
         assert is_attached is False
         assert mock_get.call_count == 2
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_no_block_found(self, mock_get):
         """Test when no matching block is found."""
         # First call: agent blocks (empty)
@@ -71,7 +94,7 @@ class TestFindMemoryBlock:
         mock_global_response.json.return_value = []
         mock_global_response.raise_for_status = Mock()
 
-        mock_get.side_effect = [mock_agent_response, mock_global_response]
+        mock_get.side_effect = route_by_stage(mock_agent_response, mock_global_response)
 
         block, is_attached = find_memory_block("agent-789", "nonexistent_label")
 
@@ -79,7 +102,7 @@ class TestFindMemoryBlock:
         assert is_attached is False
         assert mock_get.call_count == 2
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_with_dict_response(self, mock_get):
         """Test handling response as a dict with 'blocks' key."""
         # Some APIs return {"blocks": [...]} instead of [...]
@@ -98,7 +121,7 @@ class TestFindMemoryBlock:
         assert block["id"] == "block-dict-123"
         assert is_attached is True
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_without_agent_id(self, mock_get):
         """Test that providing no agent_id returns (None, False)."""
         block, is_attached = find_memory_block("", "cumulative_context")
@@ -107,7 +130,7 @@ class TestFindMemoryBlock:
         assert is_attached is False
         mock_get.assert_not_called()
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_none_agent_id(self, mock_get):
         """Test that providing None agent_id returns (None, False)."""
         block, is_attached = find_memory_block(None, "cumulative_context")
@@ -116,7 +139,7 @@ class TestFindMemoryBlock:
         assert is_attached is False
         mock_get.assert_not_called()
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_handles_request_exception(self, mock_get):
         """Test that request exceptions are caught and return (None, False)."""
         mock_get.side_effect = requests.exceptions.RequestException("Network error")
@@ -126,7 +149,7 @@ class TestFindMemoryBlock:
         assert block is None
         assert is_attached is False
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_handles_http_error(self, mock_get):
         """Test handling of HTTP errors."""
         mock_response = Mock()
@@ -138,7 +161,7 @@ class TestFindMemoryBlock:
         assert block is None
         assert is_attached is False
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_handles_generic_exception(self, mock_get):
         """Test handling of unexpected exceptions."""
         mock_get.side_effect = ValueError("Unexpected error")
@@ -148,7 +171,7 @@ class TestFindMemoryBlock:
         assert block is None
         assert is_attached is False
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_adds_user_id_header(self, mock_get):
         """Test that user_id header is added for agent blocks request."""
         mock_response = Mock()
@@ -163,7 +186,7 @@ class TestFindMemoryBlock:
         headers = first_call_args[1]['headers']
         assert headers.get('user_id') == "agent-test-123"
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_global_search_params(self, mock_get):
         """Test that global blocks search includes correct parameters."""
         # First call: agent blocks (empty)
@@ -176,35 +199,40 @@ class TestFindMemoryBlock:
         mock_global_response.json.return_value = []
         mock_global_response.raise_for_status = Mock()
 
-        mock_get.side_effect = [mock_agent_response, mock_global_response]
+        mock_get.side_effect = route_by_stage(mock_agent_response, mock_global_response)
 
         find_memory_block("agent-789", "test_label")
 
-        # Check second call (global blocks) has correct params
-        second_call_args = mock_get.call_args_list[1]
-        params = second_call_args[1]['params']
+        # Check the global blocks call has correct params
+        global_calls = [c for c in mock_get.call_args_list if 'params' in c[1]]
+        assert len(global_calls) == 1
+        params = global_calls[0][1]['params']
         assert params['label'] == "test_label"
         assert params['templates_only'] == "false"
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_prefers_attached_over_global(self, mock_get):
-        """Test that attached blocks are found before checking global blocks."""
-        # If block exists in agent blocks, should not check global
-        mock_response = Mock()
-        mock_response.json.return_value = [
+        """Test that an attached block wins over a global block with the same label."""
+        mock_agent_response = Mock()
+        mock_agent_response.json.return_value = [
             {"id": "block-attached-123", "label": "cumulative_context", "value": "content"}
         ]
-        mock_response.raise_for_status = Mock()
-        mock_get.return_value = mock_response
+        mock_agent_response.raise_for_status = Mock()
+
+        mock_global_response = Mock()
+        mock_global_response.json.return_value = [
+            {"id": "block-global-123", "label": "cumulative_context", "value": "global"}
+        ]
+        mock_global_response.raise_for_status = Mock()
+
+        mock_get.side_effect = route_by_stage(mock_agent_response, mock_global_response)
 
         block, is_attached = find_memory_block("agent-789", "cumulative_context")
 
-        assert block is not None
+        assert block["id"] == "block-attached-123"
         assert is_attached is True
-        # Should only call once (agent blocks endpoint)
-        assert mock_get.call_count == 1
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_returns_first_matching_global_block(self, mock_get):
         """Test that first matching global block is returned when multiple exist."""
         # First call: agent blocks (empty)
@@ -220,7 +248,7 @@ class TestFindMemoryBlock:
         ]
         mock_global_response.raise_for_status = Mock()
 
-        mock_get.side_effect = [mock_agent_response, mock_global_response]
+        mock_get.side_effect = route_by_stage(mock_agent_response, mock_global_response)
 
         block, is_attached = find_memory_block("agent-789", "cumulative_context")
 
@@ -228,7 +256,7 @@ class TestFindMemoryBlock:
         assert block["id"] == "block-global-1"
         assert is_attached is False
 
-    @patch('webhook_server.block_finders.requests.get')
+    @patch('webhook_server.block_finders.letta_session.get')
     def test_find_block_with_timeout(self, mock_get):
         """Test that requests have timeout configured."""
         mock_response = Mock()
@@ -238,7 +266,188 @@ class TestFindMemoryBlock:
 
         find_memory_block("agent-789", "cumulative_context")
 
-        # Check that timeout was specified
-        first_call = mock_get.call_args_list[0]
-        assert 'timeout' in first_call[1]
-        assert first_call[1]['timeout'] == 10
+        # Check that timeout was specified on both lookups
+        for call in mock_get.call_args_list:
+            assert call[1].get('timeout') == LETTA_TIMEOUT
+
+
+class TestBlockLookupCaches:
+    """Tests for the attached- and global-blocks lookup caches."""
+
+    @staticmethod
+    def _responses(global_blocks):
+        agent_response = Mock()
+        agent_response.json.return_value = []
+        agent_response.raise_for_status = Mock()
+        global_response = Mock()
+        global_response.json.return_value = global_blocks
+        global_response.raise_for_status = Mock()
+        return agent_response, global_response
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_second_lookup_reuses_cached_global_blocks(self, mock_get):
+        """Test that a repeated lookup for the same label skips the global GET."""
+        mock_get.side_effect = route_by_stage(*self._responses(
+            [{"id": "block-global-1", "label": "cumulative_context", "value": "v"}]
+        ), {"block-global-1": {"id": "block-global-1", "label": "cumulative_context", "value": "v"}})
+
+        find_memory_block("agent-1", "cumulative_context")
+        block, is_attached = find_memory_block("agent-2", "cumulative_context")
+
+        assert block["id"] == "block-global-1"
+        assert is_attached is False
+        global_calls = [c for c in mock_get.call_args_list if 'params' in c[1]]
+        assert len(global_calls) == 1
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_invalidate_forces_refetch(self, mock_get):
+        """Test that invalidating a label makes the next lookup hit the API again."""
+        mock_get.side_effect = route_by_stage(*self._responses([]))
+
+        find_memory_block("agent-1", "cumulative_context")
+        invalidate_global_blocks("cumulative_context")
+        find_memory_block("agent-1", "cumulative_context")
+
+        global_calls = [c for c in mock_get.call_args_list if 'params' in c[1]]
+        assert len(global_calls) == 2
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_attached_blocks_fetched_once_per_agent(self, mock_get):
+        """Test that lookups for different labels on one agent share the attached-blocks fetch."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "a"},
+            {"id": "block-2", "label": "graphiti_context", "value": "b"},
+        ]
+        mock_get.side_effect = route_by_stage(agent_response, global_response, {
+            "block-2": {"id": "block-2", "label": "graphiti_context", "value": "b"},
+        })
+
+        first, _ = find_memory_block("agent-1", "cumulative_context")
+        second, is_attached = find_memory_block("agent-1", "graphiti_context")
+
+        assert first["id"] == "block-1"
+        assert second["id"] == "block-2"
+        assert is_attached is True
+        list_calls = [c for c in mock_get.call_args_list if c[0][0].endswith("/core-memory/blocks")]
+        assert len(list_calls) == 1
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_warm_attached_hit_skips_global_lookup(self, mock_get):
+        """Test that a cached attached label costs one block read and no list or global lookup."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "a"},
+        ]
+        mock_get.side_effect = route_by_stage(agent_response, global_response, {
+            "block-1": {"id": "block-1", "label": "cumulative_context", "value": "a"},
+        })
+
+        find_memory_block("agent-1", "cumulative_context")
+        mock_get.reset_mock()
+        block, is_attached = find_memory_block("agent-1", "cumulative_context")
+
+        assert block["id"] == "block-1"
+        assert is_attached is True
+        assert mock_get.call_count == 1
+        assert mock_get.call_args[0][0].endswith("/blocks/block-1")
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_warm_attached_hit_reads_current_value(self, mock_get):
+        """Test that a block edited since it was listed is returned with its current value."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "listed"},
+        ]
+        mock_get.side_effect = route_by_stage(agent_response, global_response, {
+            "block-1": {"id": "block-1", "label": "cumulative_context", "value": "edited by agent"},
+        })
+
+        find_memory_block("agent-1", "cumulative_context")
+        block, _ = find_memory_block("agent-1", "cumulative_context")
+
+        assert block["value"] == "edited by agent"
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_failed_block_read_drops_cached_ids(self, mock_get):
+        """Test that a cached id whose block can no longer be read is forgotten."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "a"},
+        ]
+        missing = Mock()
+        missing.raise_for_status.side_effect = requests.exceptions.HTTPError("404 Not Found")
+        route = route_by_stage(agent_response, global_response)
+        mock_get.side_effect = lambda url, **kwargs: missing if url.endswith("/blocks/block-1") else route(url, **kwargs)
+
+        find_memory_block("agent-1", "cumulative_context")
+        block, is_attached = find_memory_block("agent-1", "cumulative_context")
+
+        assert (block, is_attached) == (None, False)
+        assert _attached_blocks_cache.get("agent-1") is None
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_cold_lookup_of_known_attached_label_skips_global_lookup(self, mock_get):
+        """Test that once the id manifest expires, a label seen attached is not searched globally."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "a"},
+        ]
+        mock_get.side_effect = route_by_stage(agent_response, global_response)
+
+        find_memory_block("agent-1", "cumulative_context")
+        _attached_blocks_cache.clear()  # manifest expired; the label hint outlives it
+        mock_get.reset_mock()
+        block, is_attached = find_memory_block("agent-1", "cumulative_context")
+
+        assert block["id"] == "block-1"
+        assert is_attached is True
+        assert mock_get.call_count == 1
+        assert "params" not in mock_get.call_args[1]
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_cold_lookup_of_unknown_label_starts_global_lookup(self, mock_get):
+        """Test that a new agent or a label never seen attached still gets the speculative global search."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "a"},
+        ]
+        mock_get.side_effect = route_by_stage(agent_response, global_response)
+
+        with patch('webhook_server.block_finders._lookup_pool') as mock_pool:
+            mock_pool.submit.return_value.result.return_value = None
+            find_memory_block("agent-1", "cumulative_context")
+            _attached_blocks_cache.clear()
+            block, _ = find_memory_block("agent-1", "graphiti_context")
+
+        assert block is None
+        # Both lookups speculate: the first because nothing is known about the new agent
+        submitted_labels = [c[0][1] for c in mock_pool.submit.call_args_list]
+        assert submitted_labels == ["cumulative_context", "graphiti_context"]
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_cached_global_hit_reads_current_value(self, mock_get):
+        """Test that a global block edited since it was listed is returned with its current value."""
+        mock_get.side_effect = route_by_stage(*self._responses(
+            [{"id": "block-global-1", "label": "cumulative_context", "value": "listed"}]
+        ), {"block-global-1": {"id": "block-global-1", "label": "cumulative_context", "value": "edited"}})
+
+        find_memory_block("agent-1", "cumulative_context")
+        block, is_attached = find_memory_block("agent-2", "cumulative_context")
+
+        assert block["value"] == "edited"
+        assert is_attached is False
+
+    @patch('webhook_server.block_finders.letta_session.get')
+    def test_first_attached_block_wins_for_duplicate_labels(self, mock_get):
+        """Test that the first attached block with a label is returned when several share it."""
+        agent_response, global_response = self._responses([])
+        agent_response.json.return_value = [
+            {"id": "block-1", "label": "cumulative_context", "value": "a"},
+            {"id": "block-2", "label": "cumulative_context", "value": "b"},
+        ]
+        mock_get.side_effect = route_by_stage(agent_response, global_response)
+
+        block, _ = find_memory_block("agent-1", "cumulative_context")
+
+        assert block["id"] == "block-1"
@@ -0,0 +1,73 @@
+"""
+Unit tests for webhook_server.cache module.
+
+Tests TTL expiry, LRU eviction and invalidation of TTLCache.
+"""
+
+from webhook_server.cache import TTLCache
+
+
+class FakeClock:
+    """Manually advanced clock for expiry tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Tests for TTLCache class."""
+
+    def test_get_returns_stored_value(self):
+        """Test that a stored value is returned before it expires."""
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set("key", [1, 2])
+
+        assert cache.get("key") == [1, 2]
+
+    def test_get_missing_returns_default(self):
+        """Test that a missing key returns the default."""
+        cache = TTLCache(maxsize=4, ttl=10)
+
+        assert cache.get("missing") is None
+        assert cache.get("missing", "fallback") == "fallback"
+
+    def test_entry_expires_after_ttl(self):
+        """Test that entries are dropped once the TTL elapses."""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=4, ttl=10, timer=clock)
+        cache.set("key", "value")
+
+        clock.now = 9.9
+        assert cache.get("key") == "value"
+
+        clock.now = 10.0
+        assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entry is evicted when full."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_pop_and_clear(self):
+        """Test that pop removes one entry and clear removes all."""
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        assert cache.pop("a") == 1
+        assert cache.pop("a") is None
+        assert cache.get("b") == 2
+
+        cache.clear()
+        assert len(cache) == 0
@@ -5,13 +5,17 @@ Tests context building, deduplication, truncation, and similarity detection.
 """
 
 import pytest
+from unittest.mock import patch
 from datetime import datetime, UTC
 from webhook_server.context_utils import (
     _build_cumulative_context,
     _parse_context_entries,
     _is_content_similar,
     _is_content_similar_with_query_awareness,
+    _truncate_entries,
     _truncate_oldest_entries,
+    _now_utc_str,
+    _classify_content,
     MAX_CONTEXT_SNIPPET_LENGTH
 )
 
@@ -78,6 +82,53 @@ class TestBuildCumulativeContext:
         # New content should be in the result
         assert "NEW_IMPORTANT_CONTENT" in result or "TRUNCATED" in result
 
+    def test_build_context_truncation_matches_truncating_full_context(self):
+        """Test that truncating from parsed entries matches truncating the concatenated string."""
+        existing = (
+            "Legacy " + "L" * 2000 +
+            "\n\n--- CONTEXT ENTRY (2024-01-15 09:00:00 UTC) ---\n\n" + "A" * (MAX_CONTEXT_SNIPPET_LENGTH // 2)
+        )
+        new_context = "B" * 3000
+        separator = "\n\n--- CONTEXT ENTRY (2024-01-15 10:00:00 UTC) ---\n\n"
+
+        with patch("webhook_server.context_utils._now_utc_str", return_value="2024-01-15 10:00:00 UTC"):
+            result = _build_cumulative_context(existing, new_context)
+
+        expected = _truncate_oldest_entries(existing + separator + new_context, MAX_CONTEXT_SNIPPET_LENGTH)
+        assert result == expected
+
+    def test_build_context_repost_of_latest_entry_skips_parsing(self):
+        """Test that an identical repost of the latest entry returns early without parsing."""
+        existing = (
+            "Legacy notes"
+            "\n\n--- CONTEXT ENTRY (2024-01-15 10:00:00 UTC) ---\n\nRepeated webhook context"
+        )
+
+        with patch("webhook_server.context_utils._parse_context_entries") as mock_parse:
+            result = _build_cumulative_context(existing, "Repeated webhook context\n")
+
+        assert result == existing
+        mock_parse.assert_not_called()
+
+    def test_build_context_partial_tail_match_is_not_a_repost(self):
+        """Test that new context matching only the end of the latest entry is not short-circuited."""
+        existing = "\n\n--- CONTEXT ENTRY (2024-01-15 10:00:00 UTC) ---\n\nAlpha beta gamma delta"
+
+        with patch("webhook_server.context_utils._parse_context_entries",
+                   wraps=_parse_context_entries) as mock_parse:
+            _build_cumulative_context(existing, "gamma delta")
+
+        mock_parse.assert_called()
+
+    def test_build_context_graphiti_repost_is_still_appended(self):
+        """Test that a repeated Graphiti search result is appended rather than deduplicated."""
+        graphiti = "Relevant Entities from Knowledge Graph:\n- Entity A"
+        existing = "\n\n--- CONTEXT ENTRY (2024-01-15 10:00:00 UTC) ---\n\n" + graphiti
+
+        result = _build_cumulative_context(existing, graphiti)
+
+        assert result.count(graphiti) == 2
+
     def test_build_context_with_whitespace_only_existing(self):
         """Test handling of whitespace-only existing context."""
         result = _build_cumulative_context("   \n\n  ", "New content")
@@ -182,6 +233,60 @@ class TestIsContentSimilar:
         assert _is_content_similar(short, long) is True
 
 
+def _reference_is_content_similar(content1, content2):
+    """Straightforward lowercase-first version of the similarity check."""
+    if not content1 or not content2:
+        return False
+    a, b = content1.strip().lower(), content2.strip().lower()
+    if a == b:
+        return True
+    shorter, longer = min(len(a), len(b)), max(len(a), len(b))
+    if shorter > 0 and longer > 0:
+        if shorter / longer < 0.8:
+            return a in b or b in a
+        union = set(a) | set(b)
+        return len(set(a) & set(b)) / len(union) > 0.9
+    return False
+
+
+class TestIsContentSimilarIdentical:
+    """Tests for the identical-content fast path."""
+
+    @pytest.mark.parametrize("content", ["Identical content", "  padded  ", "   ", "Ünïcode"])
+    def test_identical_content_is_similar(self, content):
+        """Test that identical strings are similar, including whitespace-only ones."""
+        assert _is_content_similar(content, content) is True
+        assert _is_content_similar(content, "".join(content)) is True
+
+    def test_identical_graphiti_search_still_differs(self):
+        """Test that identical fresh Graphiti results are still treated as different."""
+        graphiti = "Relevant Entities from Knowledge Graph:\n- Entity A"
+
+        assert _is_content_similar_with_query_awareness(graphiti, graphiti) is False
+
+
+class TestIsContentSimilarLazyLowercase:
+    """Tests that deferred lowercasing in _is_content_similar matches lowercase-first results."""
+
+    @pytest.mark.parametrize("content1,content2", [
+        ("Hello World", "hello world"),
+        ("  Hello World  ", "HELLO WORLD"),
+        ("Hello", "Hello World and more"),
+        ("HELLO", "say hello world to everyone"),
+        ("The Quick Brown Fox", "the quick brown fax"),
+        ("ABCDEFGHIJ", "abcdefghiz"),
+        ("abc", "xyz"),
+        ("Straße", "STRASSE"),
+        ("İstanbul", "istanbul"),
+        ("Ünïcode Text", "ünïcode text"),
+        ("   ", " "),
+    ])
+    def test_matches_reference(self, content1, content2):
+        """Test agreement with the lowercase-first reference on ASCII and non-ASCII input."""
+        assert _is_content_similar(content1, content2) == _reference_is_content_similar(content1, content2)
+        assert _is_content_similar(content2, content1) == _reference_is_content_similar(content2, content1)
+
+
 class TestIsContentSimilarWithQueryAwareness:
     """Tests for _is_content_similar_with_query_awareness function."""
 
@@ -252,6 +357,19 @@ class TestTruncateOldestEntries:
         assert "Recent entry" in result
         assert len(result) <= 500
 
+    def test_truncation_keeps_notice_first_and_entries_in_order(self):
+        """Test that kept entries stay oldest-to-newest after the truncation notice."""
+        context = (
+            "\n\n--- CONTEXT ENTRY (2024-01-15 08:00:00 UTC) ---\n\n" + "A" * 2000 +
+            "\n\n--- CONTEXT ENTRY (2024-01-15 09:00:00 UTC) ---\n\nsecond" +
+            "\n\n--- CONTEXT ENTRY (2024-01-15 10:00:00 UTC) ---\n\nthird"
+        )
+        result = _truncate_oldest_entries(context, 500)
+
+        assert result.startswith("--- OLDER ENTRIES TRUNCATED ---")
+        assert "A" * 100 not in result
+        assert result.index("second") < result.index("third")
+
     def test_truncation_adds_notice(self):
         """Test that truncation adds a notice."""
         long_context = (
@@ -290,6 +408,48 @@ class TestTruncateOldestEntries:
         assert len(result) <= 1000
         assert "Z" in result
 
+    def test_truncate_entries_without_entries_is_empty(self):
+        """Test that rendering no parsed entries yields an empty string."""
+        assert _truncate_entries([], 1000) == ""
+
+
+class TestClassifyContent:
+    """Tests for _classify_content function."""
+
+    @pytest.mark.parametrize("content,expected", [
+        ("plain text", 0),
+        ("**Recent Research Papers (arXiv)**\n1. Paper", 1),
+        ("Relevant Entities from Knowledge Graph:\n- Entity", 2),
+        ("**Recent Research Papers (arXiv)**\n...\nRelevant Entities from Knowledge Graph:", 3),
+    ])
+    def test_reports_every_kind_present(self, content, expected):
+        """Test that each sentinel present sets its bit, including both at once."""
+        assert _classify_content(content) == expected
+
+
+class TestNowUtcStr:
+    """Tests for _now_utc_str function."""
+
+    def test_matches_entry_timestamp_format(self):
+        """Test that the timestamp uses the context entry format."""
+        result = _now_utc_str()
+
+        parsed = datetime.strptime(result, "%Y-%m-%d %H:%M:%S UTC")
+        assert abs(parsed.replace(tzinfo=UTC) - datetime.now(UTC)).total_seconds() < 5
+
+    def test_reformats_only_when_second_changes(self):
+        """Test that calls within the same second reuse the formatted string."""
+        with patch('webhook_server.context_utils.time.time', return_value=1705312800.2):
+            first = _now_utc_str()
+        with patch('webhook_server.context_utils.time.time', return_value=1705312800.9):
+            second = _now_utc_str()
+        with patch('webhook_server.context_utils.time.time', return_value=1705312801.0):
+            third = _now_utc_str()
+
+        assert first == "2024-01-15 10:00:00 UTC"
+        assert second is first
+        assert third == "2024-01-15 10:00:01 UTC"
+
 
 class TestContextUtilsEdgeCases:
     """Edge case tests for context utilities."""
@@ -0,0 +1,86 @@
+"""
+Unit tests for webhook_server.executors module.
+
+Tests task execution, worker bounds and daemon shutdown of DaemonThreadPool.
+"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from webhook_server.executors import DaemonThreadPool
+
+
+class TestDaemonThreadPool:
+    """Tests for DaemonThreadPool class."""
+
+    def test_submit_returns_result(self):
+        """Test that the Future resolves to the task's return value."""
+        pool = DaemonThreadPool(max_workers=2)
+
+        assert pool.submit(lambda a, b=0: a + b, 1, b=2).result(timeout=5) == 3
+
+    def test_exception_is_set_on_future(self):
+        """Test that a raising task surfaces its exception through the Future."""
+        pool = DaemonThreadPool(max_workers=1)
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError, match="boom"):
+            pool.submit(fail).result(timeout=5)
+
+    def test_workers_are_daemon_and_bounded(self):
+        """Test that no more than max_workers daemon threads are started."""
+        pool = DaemonThreadPool(max_workers=2, thread_name_prefix="test-pool")
+        release = threading.Event()
+
+        futures = [pool.submit(release.wait, 5) for _ in range(5)]
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+
+        assert len(pool._threads) == 2
+        assert all(t.daemon and t.name.startswith("test-pool") for t in pool._threads)
+
+    def test_idle_worker_is_reused(self):
+        """Test that sequential tasks share one worker instead of starting new ones."""
+        pool = DaemonThreadPool(max_workers=4)
+
+        for _ in range(3):
+            pool.submit(lambda: None).result(timeout=5)
+            time.sleep(0.01)  # let the worker mark itself idle
+
+        assert len(pool._threads) == 1
+
+    def test_cancelled_task_does_not_run(self):
+        """Test that a task cancelled while queued is skipped."""
+        pool = DaemonThreadPool(max_workers=1)
+        release = threading.Event()
+        ran = []
+
+        blocker = pool.submit(release.wait, 5)
+        queued = pool.submit(ran.append, 1)
+        assert queued.cancel()
+        release.set()
+        blocker.result(timeout=5)
+        pool.submit(lambda: None).result(timeout=5)
+
+        assert ran == []
+
+    def test_pending_work_does_not_delay_exit(self):
+        """Test that the interpreter exits without waiting for running or queued tasks."""
+        script = (
+            "import time\n"
+            "from webhook_server.executors import DaemonThreadPool\n"
+            "pool = DaemonThreadPool(max_workers=1)\n"
+            "pool.submit(time.sleep, 30)\n"
+            "pool.submit(time.sleep, 30)\n"
+        )
+        start = time.monotonic()
+        subprocess.run([sys.executable, "-c", script], check=True, timeout=20)
+
+        assert time.monotonic() - start < 10
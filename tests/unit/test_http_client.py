@@ -0,0 +1,71 @@
+"""
+Unit tests for webhook_server.http_client module.
+
+Tests shared session construction: retry policy, pooling and default headers.
+"""
+
+import requests
+
+from urllib3.util.retry import Retry
+
+from webhook_server.http_client import build_session, letta_session, RETRY_STATUS_CODES
+
+
+class TestBuildSession:
+    """Tests for build_session function."""
+
+    def test_returns_requests_session(self):
+        """Test that a requests.Session is returned."""
+        session = build_session()
+
+        assert isinstance(session, requests.Session)
+
+    def test_mounts_retry_adapter_for_both_schemes(self):
+        """Test that http and https share the retrying adapter."""
+        session = build_session(retries=5, backoff_factor=0.5)
+
+        http_adapter = session.get_adapter("http://example.com")
+        https_adapter = session.get_adapter("https://example.com")
+
+        assert http_adapter is https_adapter
+        assert http_adapter.max_retries.total == 5
+        assert http_adapter.max_retries.backoff_factor == 0.5
+        assert set(http_adapter.max_retries.status_forcelist) == set(RETRY_STATUS_CODES)
+
+    def test_pool_size_is_configurable(self):
+        """Test that the connection pool size is passed to the adapter."""
+        session = build_session(pool_maxsize=32)
+
+        assert session.get_adapter("http://example.com")._pool_maxsize == 32
+
+    def test_default_headers_are_applied(self):
+        """Test that default headers are set on the session."""
+        session = build_session(headers={"Authorization": "Bearer token"})
+
+        assert session.headers["Authorization"] == "Bearer token"
+
+    def test_retries_only_idempotent_methods_by_default(self):
+        """Test that POST is not retried unless explicitly allowed."""
+        session = build_session()
+
+        allowed = session.get_adapter("http://example.com").max_retries.allowed_methods
+        assert allowed == Retry.DEFAULT_ALLOWED_METHODS
+        assert "POST" not in allowed
+
+    def test_allowed_methods_are_configurable(self):
+        """Test that retryable methods can be overridden."""
+        session = build_session(allowed_methods=("GET", "PATCH"))
+
+        allowed = session.get_adapter("http://example.com").max_retries.allowed_methods
+        assert allowed == frozenset({"GET", "PATCH"})
+
+
+class TestLettaSession:
+    """Tests for the shared Letta session."""
+
+    def test_never_retries_block_creation(self):
+        """Test that the Letta session retries GET/PATCH but not POST."""
+        allowed = letta_session.get_adapter("http://example.com").max_retries.allowed_methods
+
+        assert {"GET", "PATCH"} <= allowed
+        assert "POST" not in allowed
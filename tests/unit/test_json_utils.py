@@ -0,0 +1,64 @@
+"""
+Unit tests for webhook_server.json_utils module.
+
+Tests JSON decoding and encoding with and without the optional orjson fast path.
+"""
+
+import json
+from unittest.mock import Mock, patch
+
+from webhook_server import json_utils
+from webhook_server.json_utils import dumps_pretty, response_json
+
+
+class TestResponseJson:
+    """Tests for response_json function."""
+
+    def test_decodes_raw_content(self):
+        """Test that a byte body is decoded directly."""
+        response = Mock()
+        response.content = b'[{"id": "block-1"}]'
+
+        result = response_json(response)
+
+        assert result == [{"id": "block-1"}]
+        if json_utils.orjson is not None:
+            response.json.assert_not_called()
+
+    def test_uses_response_json_without_byte_body(self):
+        """Test fallback to response.json() when there is no raw byte body."""
+        response = Mock()
+        response.json.return_value = {"id": "block-1"}
+
+        assert response_json(response) == {"id": "block-1"}
+
+    def test_uses_response_json_without_orjson(self):
+        """Test fallback to response.json() when orjson is unavailable."""
+        response = Mock()
+        response.content = b'{"id": "raw"}'
+        response.json.return_value = {"id": "block-1"}
+
+        with patch.object(json_utils, "orjson", None):
+            assert response_json(response) == {"id": "block-1"}
+
+
+class TestDumpsPretty:
+    """Tests for dumps_pretty function."""
+
+    def test_matches_stdlib_indented_output(self):
+        """Test that output decodes back to the same object with 2-space indentation."""
+        payload = {"type": "message_sent", "request": {"path": "/v1/agents/agent-1"}, "n": [1, 2]}
+
+        result = dumps_pretty(payload)
+
+        assert json.loads(result) == payload
+        assert '\n  "type"' in result
+
+    def test_falls_back_for_non_str_keys(self):
+        """Test that objects orjson rejects are serialized by the stdlib encoder."""
+        assert json.loads(dumps_pretty({1: "one"})) == {"1": "one"}
+
+    def test_falls_back_without_orjson(self):
+        """Test that the stdlib encoder is used when orjson is unavailable."""
+        with patch.object(json_utils, "orjson", None):
+            assert dumps_pretty({"a": 1}) == json.dumps({"a": 1}, indent=2)
@@ -0,0 +1,62 @@
+"""
+Unit tests for webhook_server.logging_config module.
+
+Tests root logger setup with a background queue listener.
+"""
+
+import logging
+from logging.handlers import QueueHandler
+
+import pytest
+
+from webhook_server import logging_config
+
+
+@pytest.fixture
+def restore_root_logger():
+    """Undo configure_logging so other tests see the default root logger."""
+    root = logging.getLogger()
+    original_level = root.level
+    original_handlers = list(root.handlers)
+    yield
+    logging_config._stop_listener()
+    root.handlers[:] = original_handlers
+    root.setLevel(original_level)
+
+
+class TestConfigureLogging:
+    """Tests for configure_logging function."""
+
+    def test_installs_queue_handler_and_level(self, restore_root_logger):
+        """Test that the root logger enqueues records at the requested level."""
+        logging_config.configure_logging("debug")
+
+        root = logging.getLogger()
+        assert root.level == logging.DEBUG
+        assert any(isinstance(h, QueueHandler) for h in root.handlers)
+        assert logging_config._listener is not None
+
+    def test_level_defaults_to_env(self, restore_root_logger, monkeypatch):
+        """Test that LOG_LEVEL is used when no level is passed."""
+        monkeypatch.setenv("LOG_LEVEL", "warning")
+
+        logging_config.configure_logging()
+
+        assert logging.getLogger().level == logging.WARNING
+
+    def test_is_idempotent(self, restore_root_logger):
+        """Test that repeated calls do not stack handlers."""
+        logging_config.configure_logging("info")
+        logging_config.configure_logging("info")
+
+        queue_handlers = [h for h in logging.getLogger().handlers if isinstance(h, QueueHandler)]
+        assert len(queue_handlers) == 1
+
+    def test_stop_listener_is_safe_when_not_running(self, restore_root_logger):
+        """Test that the exit hook tolerates a listener that was already stopped."""
+        logging_config.configure_logging("info")
+
+        logging_config._stop_listener()
+        logging_config._stop_listener()
+
+        assert logging_config._listener is None
@@ -5,9 +5,12 @@ Tests memory block creation, updates, and attachment operations.
 """
 
 import pytest
+import threading
+import time
 from unittest.mock import Mock, patch, MagicMock
 import requests
 
+from webhook_server import memory_manager
 from webhook_server.memory_manager import (
     create_memory_block,
     update_memory_block,
@@ -20,7 +23,7 @@ class TestCreateMemoryBlock:
     """Tests for create_memory_block function."""
 
     @patch('webhook_server.memory_manager.find_memory_block')
-    @patch('webhook_server.memory_manager.requests.post')
+    @patch('webhook_server.memory_manager.letta_session.post')
     @patch('webhook_server.memory_manager.attach_block_to_agent')
     def test_create_new_block_without_agent(self, mock_attach, mock_post, mock_find):
         """Test creating a new memory block without agent_id."""
@@ -47,7 +50,7 @@ class TestCreateMemoryBlock:
         mock_find.assert_not_called()
 
     @patch('webhook_server.memory_manager.find_memory_block')
-    @patch('webhook_server.memory_manager.requests.post')
+    @patch('webhook_server.memory_manager.letta_session.post')
     @patch('webhook_server.memory_manager.attach_block_to_agent')
     def test_create_new_block_with_agent_auto_attach(self, mock_attach, mock_post, mock_find):
         """Test creating a new block with agent_id triggers auto-attachment."""
@@ -132,12 +135,103 @@ class TestCreateMemoryBlock:
         mock_attach.assert_called_once_with("agent-123", "block-999")
         mock_update.assert_called_once()
 
+    @patch('webhook_server.memory_manager.find_memory_block')
+    @patch('webhook_server.memory_manager.update_memory_block')
+    @patch('webhook_server.memory_manager.attach_block_to_agent')
+    def test_attach_and_update_of_unattached_block_overlap(self, mock_attach, mock_update, mock_find):
+        """Test that the attach PATCH is in flight while the update PATCH runs."""
+        mock_find.return_value = ({"id": "block-999", "value": "Existing"}, False)
+        update_started = threading.Event()
+        overlapped = []
+
+        def attach(agent_id, block_id):
+            overlapped.append(update_started.wait(timeout=2))
+            return True
+
+        def update(*args):
+            update_started.set()
+            return {"id": "block-999", "value": "Updated"}
+
+        mock_attach.side_effect = attach
+        mock_update.side_effect = update
+
+        result = create_memory_block({"label": "cumulative_context", "value": "New"}, agent_id="agent-123")
+
+        assert result == {"id": "block-999", "value": "Updated"}
+        assert overlapped == [True]
+
+
+class TestCreateMemoryBlockWriteLock:
+    """Tests for serialization of concurrent create_memory_block calls per agent and label."""
+
+    def _run_concurrently(self, calls):
+        """Run create_memory_block for each (block_data, agent_id) on its own thread and wait."""
+        threads = [threading.Thread(target=create_memory_block, args=call) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    def test_writes_to_same_label_do_not_overlap(self):
+        """Test that a second write to the same label waits for the first and both are applied."""
+        active = []
+        overlapped = []
+        values = []
+
+        def slow_write(block_data, agent_id):
+            overlapped.append(bool(active))
+            active.append(1)
+            time.sleep(0.05)
+            values.append(block_data["value"])
+            active.pop()
+            return {"id": "block-1"}
+
+        with patch('webhook_server.memory_manager._create_or_update_memory_block',
+                   side_effect=slow_write):
+            self._run_concurrently([
+                ({"label": "cumulative_context", "value": "a", "metadata": {"event_type": "message_sent"}}, "agent-1"),
+                ({"label": "cumulative_context", "value": "b", "metadata": {"event_type": "stream_started"}}, "agent-1"),
+            ])
+
+        assert overlapped == [False, False]
+        assert sorted(values) == ["a", "b"]
+
+    def test_writes_to_different_labels_overlap(self):
+        """Test that writes of different labels for one agent run concurrently."""
+        both_started = threading.Barrier(2)
+
+        def write(block_data, agent_id):
+            both_started.wait(timeout=5)
+            return {"id": block_data["label"]}
+
+        with patch('webhook_server.memory_manager._create_or_update_memory_block',
+                   side_effect=write) as mock_write:
+            self._run_concurrently([
+                ({"label": "graphiti_context_agent-1", "value": "a"}, "agent-1"),
+                ({"label": "available_agents_agent-1", "value": "b"}, "agent-1"),
+            ])
+
+        assert mock_write.call_count == 2
+        assert not both_started.broken
+
+    @patch('webhook_server.memory_manager._create_or_update_memory_block')
+    def test_lock_is_released_after_failure(self, mock_write):
+        """Test that a failed write releases its lock and leaves no entry behind."""
+        mock_write.side_effect = [requests.exceptions.HTTPError("500"), {"id": "block-1"}]
+        block_data = {"label": "cumulative_context", "value": "a"}
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            create_memory_block(block_data, "agent-1")
+
+        assert create_memory_block(block_data, "agent-1") == {"id": "block-1"}
+        assert memory_manager._write_locks == {}
+
 
 class TestUpdateMemoryBlock:
     """Tests for update_memory_block function."""
 
     @patch('webhook_server.memory_manager._build_cumulative_context')
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_update_block_calls_cumulative_context(self, mock_patch, mock_build_context):
         """Test that update uses _build_cumulative_context."""
         mock_build_context.return_value = "Cumulative context"
@@ -156,7 +250,7 @@ class TestUpdateMemoryBlock:
         mock_patch.assert_called_once()
 
     @patch('webhook_server.memory_manager._build_cumulative_context')
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_update_block_with_agent_id_adds_header(self, mock_patch, mock_build_context):
         """Test that agent_id is added to headers when provided."""
         mock_build_context.return_value = "Context"
@@ -176,7 +270,7 @@ class TestUpdateMemoryBlock:
         assert headers.get('user_id') == "agent-456"
 
     @patch('webhook_server.memory_manager._build_cumulative_context')
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_update_block_with_metadata(self, mock_patch, mock_build_context):
         """Test updating block with metadata."""
         mock_build_context.return_value = "Context"
@@ -199,7 +293,39 @@ class TestUpdateMemoryBlock:
         assert json_data['metadata'] == {"source": "test", "priority": "high"}
 
     @patch('webhook_server.memory_manager._build_cumulative_context')
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
+    def test_update_block_skips_patch_when_unchanged(self, mock_patch, mock_build_context):
+        """Test that no PATCH is sent when value and metadata are unchanged."""
+        mock_build_context.return_value = "Same content"
+
+        existing_block = {"id": "block-123", "value": "Same content", "metadata": {"source": "webhook"}}
+        block_data = {"value": "Same content", "metadata": {"source": "webhook"}}
+
+        result = update_memory_block("block-123", block_data, existing_block=existing_block)
+
+        assert result is existing_block
+        mock_patch.assert_not_called()
+
+    @patch('webhook_server.memory_manager._build_cumulative_context')
+    @patch('webhook_server.memory_manager.letta_session.patch')
+    def test_update_block_patches_when_only_metadata_changes(self, mock_patch, mock_build_context):
+        """Test that a metadata-only change is still written."""
+        mock_build_context.return_value = "Same content"
+
+        mock_response = Mock()
+        mock_response.json.return_value = {"id": "block-123"}
+        mock_response.raise_for_status = Mock()
+        mock_patch.return_value = mock_response
+
+        existing_block = {"id": "block-123", "value": "Same content", "metadata": {"event_type": "message_sent"}}
+        block_data = {"value": "Same content", "metadata": {"event_type": "stream_started"}}
+
+        update_memory_block("block-123", block_data, existing_block=existing_block)
+
+        mock_patch.assert_called_once()
+
+    @patch('webhook_server.memory_manager._build_cumulative_context')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_update_block_handles_http_error(self, mock_patch, mock_build_context):
         """Test that HTTP errors are raised properly."""
         mock_build_context.return_value = "Context"
@@ -217,7 +343,7 @@ class TestUpdateMemoryBlock:
 class TestAttachBlockToAgent:
     """Tests for attach_block_to_agent function."""
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_success(self, mock_patch):
         """Test successful block attachment."""
         mock_response = Mock()
@@ -229,7 +355,7 @@ class TestAttachBlockToAgent:
         assert result is True
         mock_patch.assert_called_once()
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_with_list_block_id(self, mock_patch):
         """Test handling when block_id is accidentally passed as a list."""
         mock_response = Mock()
@@ -245,7 +371,7 @@ class TestAttachBlockToAgent:
         url = call_args[0][0]
         assert "block-456" in url
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_with_empty_list_fails(self, mock_patch):
         """Test that empty list for block_id returns False."""
         result = attach_block_to_agent("agent-123", [])
@@ -253,7 +379,7 @@ class TestAttachBlockToAgent:
         assert result is False
         mock_patch.assert_not_called()
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_handles_request_exception(self, mock_patch):
         """Test that request exceptions are caught and return False."""
         mock_patch.side_effect = requests.exceptions.RequestException("Connection error")
@@ -262,7 +388,7 @@ class TestAttachBlockToAgent:
 
         assert result is False
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_adds_user_id_header(self, mock_patch):
         """Test that user_id header is set to agent_id."""
         mock_response = Mock()
@@ -275,7 +401,7 @@ class TestAttachBlockToAgent:
         headers = call_args[1]['headers']
         assert headers.get('user_id') == "agent-789"
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_constructs_correct_url(self, mock_patch):
         """Test that the attachment URL is constructed correctly."""
         mock_response = Mock()
@@ -288,7 +414,7 @@ class TestAttachBlockToAgent:
         url = call_args[0][0]
         assert "agents/agent-999/core-memory/blocks/attach/block-888" in url
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_with_http_error(self, mock_patch):
         """Test handling of HTTP errors during attachment."""
         mock_response = Mock()
@@ -299,7 +425,7 @@ class TestAttachBlockToAgent:
 
         assert result is False
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_handles_409_conflict_as_success(self, mock_patch):
         """Test that 409 Conflict (already attached) is treated as success."""
         mock_response = Mock()
@@ -312,12 +438,26 @@ class TestAttachBlockToAgent:
         assert result is True
         mock_response.raise_for_status.assert_not_called()
 
+    @patch('webhook_server.memory_manager.letta_session.patch')
+    def test_attach_block_invalidates_cached_attached_blocks(self, mock_patch):
+        """Test that a successful attach drops the agent's cached attached-block list."""
+        from webhook_server.block_finders import _attached_blocks_cache
+
+        _attached_blocks_cache.set("agent-123", {})
+        mock_response = Mock()
+        mock_response.raise_for_status = Mock()
+        mock_patch.return_value = mock_response
+
+        attach_block_to_agent("agent-123", "block-456")
+
+        assert _attached_blocks_cache.get("agent-123") is None
+
 
 class TestMemoryManagerEdgeCases:
     """Edge case tests for memory manager module."""
 
     @patch('webhook_server.memory_manager.find_memory_block')
-    @patch('webhook_server.memory_manager.requests.post')
+    @patch('webhook_server.memory_manager.letta_session.post')
     def test_create_block_with_empty_value(self, mock_post, mock_find):
         """Test creating block with empty value."""
         mock_find.return_value = (None, False)
@@ -334,7 +474,7 @@ class TestMemoryManagerEdgeCases:
         assert "id" in result
         mock_post.assert_called_once()
 
-    @patch('webhook_server.memory_manager.requests.patch')
+    @patch('webhook_server.memory_manager.letta_session.patch')
     def test_attach_block_converts_numeric_block_id_to_string(self, mock_patch):
         """Test that numeric block_id is converted to string."""
         mock_response = Mock()
@@ -288,7 +288,7 @@ class TestGetAgentToolsWithDetails:
         result = get_agent_tools_with_details(None)
         assert result == []
 
-    @patch('webhook_server.tool_inventory.requests.get')
+    @patch('webhook_server.tool_inventory.letta_session.get')
     def test_get_tools_success(self, mock_get):
         """Test successful tool retrieval."""
         mock_response = Mock()
@@ -304,7 +304,7 @@ class TestGetAgentToolsWithDetails:
         assert len(result) == 2
         assert result[0]["name"] == "tool_one"
 
-    @patch('webhook_server.tool_inventory.requests.get')
+    @patch('webhook_server.tool_inventory.letta_session.get')
     def test_get_tools_handles_error(self, mock_get):
         """Test error handling."""
         mock_get.side_effect = Exception("Network error")
@@ -313,7 +313,7 @@ class TestGetAgentToolsWithDetails:
         
         assert result == []
 
-    @patch('webhook_server.tool_inventory.requests.get')
+    @patch('webhook_server.tool_inventory.letta_session.get')
     def test_get_tools_handles_non_list_response(self, mock_get):
         """Test handling of non-list response."""
         mock_response = Mock()
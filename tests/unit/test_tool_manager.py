@@ -7,6 +7,7 @@ Tests tool discovery, attachment, and keep-tools wildcard logic.
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 import json
+import logging
 import requests
 
 # Import the functions we're testing
@@ -20,7 +21,7 @@ from tool_manager import get_agent_tools, find_attach_tools
 class TestGetAgentTools:
     """Tests for get_agent_tools function."""
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_success(self, mock_get):
         """Test successfully retrieving agent tools."""
         mock_response = Mock()
@@ -36,7 +37,7 @@ class TestGetAgentTools:
         assert result == ["tool-123", "tool-456"]
         mock_get.assert_called_once()
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_empty_agent_id(self, mock_get):
         """Test handling of empty agent_id."""
         result = get_agent_tools("")
@@ -44,7 +45,7 @@ class TestGetAgentTools:
         assert result == []
         mock_get.assert_not_called()
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_none_agent_id(self, mock_get):
         """Test handling of None agent_id."""
         result = get_agent_tools(None)
@@ -52,7 +53,7 @@ class TestGetAgentTools:
         assert result == []
         mock_get.assert_not_called()
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_http_error(self, mock_get):
         """Test handling of HTTP error responses."""
         mock_response = Mock()
@@ -64,7 +65,7 @@ class TestGetAgentTools:
 
         assert result == []
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_request_exception(self, mock_get):
         """Test handling of request exceptions."""
         mock_get.side_effect = requests.exceptions.RequestException("Connection error")
@@ -73,7 +74,7 @@ class TestGetAgentTools:
 
         assert result == []
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_json_decode_error(self, mock_get):
         """Test handling of JSON decode errors."""
         mock_response = Mock()
@@ -86,7 +87,7 @@ class TestGetAgentTools:
 
         assert result == []
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_non_list_response(self, mock_get):
         """Test handling when response is not a list."""
         mock_response = Mock()
@@ -99,7 +100,7 @@ class TestGetAgentTools:
         # Should handle gracefully and return empty list
         assert result == []
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_includes_user_id_header(self, mock_get):
         """Test that user_id header is included in the request."""
         mock_response = Mock()
@@ -113,7 +114,7 @@ class TestGetAgentTools:
         headers = call_args[1]['headers']
         assert headers.get('user_id') == "agent-test-123"
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_includes_authentication(self, mock_get):
         """Test that authentication headers are included."""
         mock_response = Mock()
@@ -127,7 +128,7 @@ class TestGetAgentTools:
         headers = call_args[1]['headers']
         assert 'X-BARE-PASSWORD' in headers
 
-    @patch('tool_manager.requests.get')
+    @patch('tool_manager.http_session.get')
     def test_get_agent_tools_timeout_configured(self, mock_get):
         """Test that timeout is configured for the request."""
         mock_response = Mock()
@@ -145,7 +146,7 @@ class TestGetAgentTools:
 class TestFindAttachTools:
     """Tests for find_attach_tools function."""
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_success(self, mock_post):
         """Test successful tool attachment."""
         mock_response = Mock()
@@ -169,7 +170,23 @@ class TestFindAttachTools:
         assert "Attached 1 tools" in result
         mock_post.assert_called_once()
 
-    @patch('tool_manager.requests.post')
+    @pytest.mark.parametrize("debug_enabled,expected_dumps", [(False, 0), (True, 2)])
+    @patch('tool_manager.http_session.post')
+    def test_find_attach_tools_pretty_prints_only_at_debug(self, mock_post, debug_enabled, expected_dumps):
+        """Test that payload and response are only pretty-printed when DEBUG logging is enabled."""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"success": True, "details": {}}
+        mock_response.raise_for_status = Mock()
+        mock_post.return_value = mock_response
+
+        with patch('tool_manager.dumps_pretty', return_value="{}") as mock_dumps, \
+                patch.object(logging.getLogger('tool_manager'), 'isEnabledFor', return_value=debug_enabled):
+            find_attach_tools(query="search tool", agent_id="agent-789")
+
+        assert mock_dumps.call_count == expected_dumps
+
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_with_keep_tools(self, mock_post):
         """Test tool attachment with keep_tools specified."""
         mock_response = Mock()
@@ -196,7 +213,7 @@ class TestFindAttachTools:
         payload = call_args[1]['json']
         assert payload['keep_tools'] == ["tool-existing-1", "tool-existing-2"]
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_without_query(self, mock_post):
         """Test tool attachment without a query."""
         mock_response = Mock()
@@ -212,7 +229,7 @@ class TestFindAttachTools:
         payload = call_args[1]['json']
         assert 'query' not in payload
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_http_error(self, mock_post):
         """Test handling of HTTP errors."""
         mock_response = Mock()
@@ -229,7 +246,7 @@ class TestFindAttachTools:
         assert "Error" in result
         assert "500" in result or "error" in result.lower()
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_request_exception(self, mock_post):
         """Test handling of request exceptions."""
         mock_post.side_effect = requests.exceptions.RequestException("Network error")
@@ -238,7 +255,7 @@ class TestFindAttachTools:
 
         assert "Error" in result
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_custom_limit(self, mock_post):
         """Test using custom limit parameter."""
         mock_response = Mock()
@@ -253,7 +270,7 @@ class TestFindAttachTools:
         payload = call_args[1]['json']
         assert payload['limit'] == 10
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_custom_min_score(self, mock_post):
         """Test using custom min_score parameter."""
         mock_response = Mock()
@@ -268,7 +285,7 @@ class TestFindAttachTools:
         payload = call_args[1]['json']
         assert payload['min_score'] == 80.0
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_with_heartbeat(self, mock_post):
         """Test requesting heartbeat."""
         mock_response = Mock()
@@ -283,7 +300,7 @@ class TestFindAttachTools:
         payload = call_args[1]['json']
         assert payload['request_heartbeat'] is True
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_json_decode_error(self, mock_post):
         """Test handling of JSON decode errors."""
         mock_response = Mock()
@@ -298,7 +315,7 @@ class TestFindAttachTools:
         # Should handle gracefully
         assert "HTTP 200" in result or "updated" in result.lower()
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_empty_keep_tools(self, mock_post):
         """Test that empty keep_tools string is handled correctly."""
         mock_response = Mock()
@@ -313,7 +330,7 @@ class TestFindAttachTools:
         payload = call_args[1]['json']
         assert payload['keep_tools'] == []
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_whitespace_in_keep_tools(self, mock_post):
         """Test that whitespace in keep_tools is handled correctly."""
         mock_response = Mock()
@@ -333,7 +350,7 @@ class TestFindAttachTools:
         # Should strip whitespace
         assert payload['keep_tools'] == ["tool-1", "tool-2", "tool-3"]
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_headers(self, mock_post):
         """Test that correct headers are sent."""
         mock_response = Mock()
@@ -348,7 +365,7 @@ class TestFindAttachTools:
         headers = call_args[1]['headers']
         assert headers['Content-Type'] == "application/json"
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_timeout(self, mock_post):
         """Test that timeout is configured."""
         mock_response = Mock()
@@ -362,7 +379,7 @@ class TestFindAttachTools:
         call_args = mock_post.call_args
         assert call_args[1]['timeout'] == 15
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_unexpected_exception(self, mock_post):
         """Test handling of unexpected exceptions."""
         mock_post.side_effect = ValueError("Unexpected error")
@@ -372,7 +389,7 @@ class TestFindAttachTools:
         assert "Error" in result
         assert "unexpected" in result.lower()
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_return_structured_true(self, mock_post):
         """Test returning structured dict when return_structured=True."""
         mock_response = Mock()
@@ -398,7 +415,7 @@ class TestFindAttachTools:
         assert "details" in result
         assert len(result["details"]["successful_attachments"]) == 1
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_return_structured_false(self, mock_post):
         """Test returning string when return_structured=False (default)."""
         mock_response = Mock()
@@ -419,7 +436,7 @@ class TestFindAttachTools:
         # Should return a string
         assert isinstance(result, str)
 
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_structured_error_response(self, mock_post):
         """Test error response when return_structured=True.
         
@@ -435,7 +452,7 @@ class TestFindAttachTools:
         assert "Error" in str(result)
 
     @patch('tool_manager.get_agent_tools')
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_expands_wildcard_keep_tools(self, mock_post, mock_get_tools):
         """Test that '*' wildcard in keep_tools is expanded to actual tool IDs."""
         # Mock current tools for the agent
@@ -466,7 +483,7 @@ class TestFindAttachTools:
         assert len(payload['keep_tools']) == 4
 
     @patch('tool_manager.get_agent_tools')
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_wildcard_without_agent_id(self, mock_post, mock_get_tools):
         """Test that '*' wildcard is removed when no agent_id is provided."""
         mock_response = Mock()
@@ -490,7 +507,7 @@ class TestFindAttachTools:
         assert len(payload['keep_tools']) == 1
 
     @patch('tool_manager.get_agent_tools')
-    @patch('tool_manager.requests.post')
+    @patch('tool_manager.http_session.post')
     def test_find_attach_tools_wildcard_removes_duplicates(self, mock_post, mock_get_tools):
         """Test that wildcard expansion removes duplicate tool IDs."""
         # Mock returns tool-1 and tool-2
@@ -1,15 +1,32 @@
 import json
+import logging
 import requests
 import sys
 import os
 from typing import List, Dict, Optional, Any # Added for better type hinting
 
+from webhook_server.http_client import build_session
+from webhook_server.json_utils import dumps_pretty
+
+logger = logging.getLogger(__name__)
+
 # Retrieve Letta password from environment or use a default
 LETTA_PASSWORD = os.environ.get("LETTA_PASSWORD", "lettaSecurePass123")
 
 # Agent registry configuration
 AGENT_REGISTRY_URL = os.environ.get("AGENT_REGISTRY_URL", "http://192.168.50.90:8021")
 
+AGENT_TOOLS_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "X-BARE-PASSWORD": f"password {LETTA_PASSWORD}",
+}
+# The :8020 attach endpoint takes no X-BARE-PASSWORD or user_id
+ATTACH_TOOLS_HEADERS = {"Content-Type": "application/json"}
+
+# Shared keep-alive session for the tool and agent registry services (GETs retried, POSTs not)
+http_session = build_session(retries=2, backoff_factor=0.25)
+
 def get_agent_tools(agent_id: str) -> List[str]: # Return type is List of strings (tool IDs)
     """
     Get the list of tools currently attached to an agent.
@@ -28,15 +45,10 @@ def get_agent_tools(agent_id: str) -> List[str]: # Return type is List of string
     # URL for listing tools attached to an agent (port 8283)
     # Path based on user's screenshot: /v1/agents/{agent_id}/tools
     url = f"http://192.168.50.90:8283/v1/agents/{agent_id}/tools" 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-BARE-PASSWORD": f"password {LETTA_PASSWORD}",
-    }
     
     try:
         print(f"Fetching current tools for agent {agent_id} from {url} with X-BARE-PASSWORD and user_id header...", file=sys.stdout)
-        response = requests.get(url, headers=headers, timeout=15)
+        response = http_session.get(url, headers=AGENT_TOOLS_HEADERS, timeout=15)
         print(f"Get agent tools (port 8283) response status: {response.status_code}", file=sys.stdout)
         
         if response.status_code != 200:
@@ -92,9 +104,7 @@ def find_attach_tools(query: str = None, agent_id: str = None, keep_tools: str =
     """
     # URL for attaching tools (port 8020)
     url = "http://192.168.50.90:8020/api/v1/tools/attach"
-    # Headers as per user's provided code for this endpoint (no X-BARE-PASSWORD or user_id)
-    headers = {"Content-Type": "application/json"} 
-    
+
     # Convert keep_tools string to list of strings.
     # The API endpoint for attach expects "keep_tools" to be a list of tool IDs.
     # Handle "*" wildcard to mean "keep all current agent tools"
@@ -154,20 +164,21 @@ def find_attach_tools(query: str = None, agent_id: str = None, keep_tools: str =
     if agent_id is not None and agent_id.strip() != "":
         payload["agent_id"] = agent_id
 
-    print("Tool attachment payload (to :8020):", file=sys.stdout) 
-    print(json.dumps(payload, indent=2), file=sys.stdout)
+    # Pretty-printing is only paid for when DEBUG logging is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Tool attachment payload (to :8020): %s", dumps_pretty(payload))
 
     response_text_for_error = "" # To store response text for error logging
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
+        response = http_session.post(url, headers=ATTACH_TOOLS_HEADERS, json=payload, timeout=15)
         response_text_for_error = response.text # Store for potential error logging
 
         # Try to parse JSON for detailed logging, even if status code indicates error
         try:
             result = response.json()
-            print("Full API Response Details (find_attach_tools from :8020):", file=sys.stdout)
-            print(json.dumps(result, indent=2), file=sys.stdout)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Full API Response Details (find_attach_tools from :8020): %s", dumps_pretty(result))
         except json.JSONDecodeError:
             result = None
             print(f"Warning: Could not decode JSON from attach response. Status: {response.status_code}, Text: {response_text_for_error[:200]}", file=sys.stderr)
@@ -240,7 +251,7 @@ def find_agents(query: str, limit: int = 10, min_score: float = 0.3) -> str:
     
     try:
         print(f"Searching for agents with query: '{query}' (limit={limit}, min_score={min_score})", file=sys.stdout)
-        response = requests.get(url, params=params, timeout=15)
+        response = http_session.get(url, params=params, timeout=15)
         response.raise_for_status()
         
         result = response.json()
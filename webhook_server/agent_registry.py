@@ -9,8 +9,10 @@ import os
 import requests
 from typing import Dict, List, Optional
 from datetime import datetime, UTC
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from .config import LETTA_HEADERS
+from .http_client import build_session
+from .json_utils import response_json
 
 
 # Agent registry configuration
@@ -20,7 +22,12 @@ DEFAULT_MIN_SCORE = float(os.environ.get("AGENT_REGISTRY_MIN_SCORE", "0.3"))
 
 # Letta API configuration for fetching agent details
 LETTA_API_URL = os.environ.get("LETTA_API_URL", "http://192.168.50.90:8289/v1")
-LETTA_API_KEY = os.environ.get("LETTA_PASSWORD")
+
+REGISTRY_HEADERS = {"Content-Type": "application/json"}
+
+# Shared sessions for agent registry calls and Letta agent lookups (keep-alive + retry with backoff)
+registry_session = build_session()
+letta_agents_session = build_session(headers=LETTA_HEADERS)
 
 
 def get_agent_details_from_letta(agent_id: str) -> Optional[Dict]:
@@ -35,18 +42,10 @@ def get_agent_details_from_letta(agent_id: str) -> Optional[Dict]:
     """
     try:
         url = f"{LETTA_API_URL}/agents/{agent_id}"
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
-        if LETTA_API_KEY:
-            headers["Authorization"] = f"Bearer {LETTA_API_KEY}"
-        
-        response = requests.get(url, headers=headers, timeout=10)
+        response = letta_agents_session.get(url, timeout=10)
         
         if response.status_code == 200:
-            return response.json()
+            return response_json(response)
         else:
             print(f"[AGENT_REGISTRY] Error fetching agent details: {response.status_code}")
             return None
@@ -128,10 +127,8 @@ def register_agent(agent_id: str) -> bool:
         
         # Call agent registry service
         url = f"{AGENT_REGISTRY_URL}/api/v1/agents/register"
-        headers = {"Content-Type": "application/json"}
-        
         print(f"[AGENT_REGISTRY] Registering agent {agent_id} at {url}")
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        response = registry_session.post(url, json=payload, headers=REGISTRY_HEADERS, timeout=10)
         
         if response.status_code in [200, 201]:
             print(f"[AGENT_REGISTRY] Successfully registered agent {agent_id}")
@@ -163,17 +160,6 @@ def query_agent_registry(query: str, limit: int = None, min_score: float = None)
         min_score = DEFAULT_MIN_SCORE
     
     try:
-        # Configure session with retry logic
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504]
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
         # Query agent registry
         search_url = f"{AGENT_REGISTRY_URL}/api/v1/agents/search"
         params = {
@@ -184,16 +170,13 @@ def query_agent_registry(query: str, limit: int = None, min_score: float = None)
         
         print(f"[AGENT_REGISTRY] Searching agents at {search_url} with query: '{query[:100]}...'")
         
-        response = session.get(search_url, params=params, timeout=15)
+        response = registry_session.get(search_url, params=params, timeout=15)
         response.raise_for_status()
         
-        results = response.json()
+        results = response_json(response)
         
         print(f"[AGENT_REGISTRY] Found {len(results.get('agents', []))} relevant agents")
         
-        # Clean up session
-        session.close()
-        
         return {"agents": results.get("agents", []), "success": True}
         
     except requests.exceptions.RequestException as e:
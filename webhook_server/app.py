@@ -1,20 +1,24 @@
 import argparse
-import json
+import logging
 import os
 import sys
 import requests
 import threading
 import random
 import asyncio
+from collections import OrderedDict
+from functools import lru_cache
 from datetime import datetime, UTC
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
 
-from .config import get_api_url
+from .config import PROTECTED_TOOLS, TOOL_ATTACHMENT_LIMIT, TOOL_ATTACHMENT_MIN_SCORE, get_api_url
+from .http_client import LETTA_TIMEOUT, build_session, letta_session
+from .json_utils import dumps_pretty, response_json
+from .logging_config import configure_logging
 from .memory_manager import create_memory_block  # create_tool_inventory_block REMOVED - no longer needed
 from .integrations import arxiv_integration, gdelt_integration
 from .context_utils import _build_cumulative_context
+from .executors import DaemonThreadPool
 from .agent_registry import register_agent, query_agent_registry, format_agent_context
 # from .tool_inventory import build_tool_inventory_block  # REMOVED - agents use find_tools instead
 
@@ -23,22 +27,47 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from tool_manager import find_attach_tools
 from letta_tool_utils import get_find_tools_id_with_fallback, ensure_protected_tools
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 # Agent tracking for Matrix notifications
 MATRIX_CLIENT_URL = os.environ.get("MATRIX_CLIENT_URL", "http://192.168.50.90:8004")
-known_agents = set()
+# Insertion-ordered so the least recently seen agent can be evicted once the bound is hit
+MAX_KNOWN_AGENTS = 10000
+known_agents: "OrderedDict[str, None]" = OrderedDict()
 agent_tracking_lock = threading.Lock()
+# Kept alive between notifications so new-agent events reuse the Matrix connection
+matrix_session = build_session(retries=2, backoff_factor=0.5)
+# Shared workers for new-agent notification/registration instead of a thread per event;
+# daemon threads, so pending notifications never delay process exit
+_notify_pool = DaemonThreadPool(max_workers=4, thread_name_prefix="matrix-notify")
+
+# Protection is handled by the toolselector's NEVER_DETACH_TOOLS. Local PROTECTED_TOOLS
+# is kept as optional fallback only; parsed once since it is fixed for the process.
+PROTECTED_TOOL_NAMES = [t.strip() for t in PROTECTED_TOOLS.split(',') if t.strip()]
 
 def track_agent_and_notify(agent_id: str | None) -> None:
     """Track agent and notify Matrix client if new agent is detected. Also registers agent with agent registry."""
     if not agent_id or not agent_id.startswith("agent-"):
         return
     
+    # Lock-free fast path for the common case of an already-known agent;
+    # single OrderedDict operations are atomic under the GIL
+    if agent_id in known_agents:
+        try:
+            known_agents.move_to_end(agent_id)
+        except KeyError:
+            pass  # Evicted concurrently; still treat as known for this webhook
+        logger.debug("Known agent: %s", agent_id)
+        return
+    
     with agent_tracking_lock:
         if agent_id not in known_agents:
-            print(f"[AGENT_TRACKER] New agent detected: {agent_id}")
-            known_agents.add(agent_id)
+            logger.info("New agent detected: %s", agent_id)
+            known_agents[agent_id] = None
+            if len(known_agents) > MAX_KNOWN_AGENTS:
+                known_agents.popitem(last=False)
             
             # Background tasks for new agent
             def notify_and_register():
@@ -46,29 +75,29 @@ def track_agent_and_notify(agent_id: str | None) -> None:
                 try:
                     notify_url = f"{MATRIX_CLIENT_URL}/webhook/new-agent"
                     payload = {"agent_id": agent_id, "timestamp": datetime.now(UTC).isoformat()}
-                    response = requests.post(notify_url, json=payload, timeout=5)
+                    response = matrix_session.post(notify_url, json=payload, timeout=5)
                     if response.status_code == 200:
-                        print(f"[AGENT_TRACKER] Successfully notified Matrix client about new agent: {agent_id}")
+                        logger.info("Notified Matrix client about new agent: %s", agent_id)
                     else:
-                        print(f"[AGENT_TRACKER] Failed to notify Matrix client: {response.status_code} - {response.text}")
+                        logger.warning("Failed to notify Matrix client: %s - %s", response.status_code, response.text)
                 except Exception as e:
-                    print(f"[AGENT_TRACKER] Error notifying Matrix client: {e}")
+                    logger.error("Error notifying Matrix client: %s", e)
                 
                 # 2. Register with agent registry
                 try:
-                    print(f"[AGENT_TRACKER] Registering agent {agent_id} with agent registry...")
+                    logger.info("Registering agent %s with agent registry", agent_id)
                     success = register_agent(agent_id)
                     if success:
-                        print(f"[AGENT_TRACKER] Successfully registered agent {agent_id} with agent registry")
+                        logger.info("Registered agent %s with agent registry", agent_id)
                     else:
-                        print(f"[AGENT_TRACKER] Failed to register agent {agent_id} with agent registry")
+                        logger.warning("Failed to register agent %s with agent registry", agent_id)
                 except Exception as e:
-                    print(f"[AGENT_TRACKER] Error registering agent with registry: {e}")
+                    logger.error("Error registering agent with registry: %s", e)
             
             # Run both tasks in background to avoid blocking webhook processing
-            threading.Thread(target=notify_and_register, daemon=True).start()
+            _notify_pool.submit(notify_and_register)
         else:
-            print(f"[AGENT_TRACKER] Known agent: {agent_id}")
+            logger.debug("Known agent: %s", agent_id)
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -109,69 +138,107 @@ DEFAULT_MAX_FACTS = int(os.environ.get("GRAPHITI_MAX_FACTS", "20"))
 # RRF scores are reciprocal ranks (typical range 0.005-0.02). Thresholds filter only the worst noise.
 MIN_FACT_SCORE = float(os.environ.get("GRAPHITI_MIN_FACT_SCORE", "0.008"))
 MIN_NODE_SCORE = float(os.environ.get("GRAPHITI_MIN_NODE_SCORE", "0.008"))
+# Shared across Graphiti searches and episode fetches so they reuse pooled connections
+graphiti_session = build_session()
+# Runs the facts search alongside the nodes search of the same query
+_graphiti_pool = DaemonThreadPool(max_workers=8, thread_name_prefix="graphiti-search")
+# Runs the independent webhook stages (agent discovery, tool attachment) concurrently
+_webhook_stage_pool = DaemonThreadPool(max_workers=16, thread_name_prefix="webhook-stage")
 
 import re
 
+# Prompt-processing patterns, compiled once at import instead of on every webhook.
+CONVERSATION_PATH_RE = re.compile(r'/conversations/([^/]+)')
+# Path segment following the first /agents/ in a request path
+AGENT_PATH_RE = re.compile(r'/agents/([^/]*)')
+SYSTEM_REMINDER_RE = re.compile(r'<system-reminder>.*?</system-reminder>', re.DOTALL)
+MATRIX_PREFIX_RE = re.compile(r'^\[Matrix:[^\]]+\]\s*', re.IGNORECASE)
+OPENCODE_PREFIX_RE = re.compile(r'^\[MESSAGE FROM OPENCODE[^\]]*\]\s*', re.IGNORECASE)
+RESPONSE_INSTRUCTION_RE = re.compile(r'---\s*RESPONSE INSTRUCTION.*$', re.DOTALL | re.IGNORECASE)
+METADATA_TAG_RE = re.compile(r'<[a-z_-]+>.*?</[a-z_-]+>', re.DOTALL | re.IGNORECASE)
+# Wrapper-stripping rules for extract_user_intent, applied in order. Each rule is
+# (literal, prefix_only, pattern): the pattern only runs when the literal occurs
+# in the prompt (or starts it, for prefix_only), so a bare prompt never reaches
+# the regex engine.
+INTENT_STRIP_RULES = (
+    # <system-reminder> ... </system-reminder> blocks (may appear anywhere)
+    ('<system-reminder>', False, SYSTEM_REMINDER_RE),
+    # Matrix prefix: [Matrix: @user:domain in Room Name]
+    ('[', True, MATRIX_PREFIX_RE),
+    # OpenCode prefix: [MESSAGE FROM OPENCODE USER] or similar
+    ('[', True, OPENCODE_PREFIX_RE),
+    # Response instruction blocks at the end
+    ('---', False, RESPONSE_INSTRUCTION_RE),
+    # Any remaining XML-like metadata tags (e.g. <context>, <instructions>)
+    ('</', False, METADATA_TAG_RE),
+)
+# Retried and repeated webhooks carry the same prompt; remember recent cleanups.
+# Bounded since prompts can be several KB each.
+INTENT_CACHE_SIZE = 256
+
+# Greetings/acknowledgements, small-talk questions, or punctuation only. Fused into a
+# single alternation so each message is matched in one pass.
+TRIVIAL_MESSAGE_RE = re.compile(
+    r'(?:hi|hello|hey|yo|sup|thanks|thank you|ok|okay|sure|yes|no|maybe|cool|nice|great|awesome|good|bye|goodbye|later|cheers)\b'
+    r'|(?:how are you|what\'?s up|how\'?s it going)\??$'
+    r'|\W*$'
+)
+
 def resolve_agent_from_conversation(path: str) -> str | None:
     """Resolve agent_id from a /v1/conversations/{id}/messages path via the Letta API."""
-    match = re.search(r'/conversations/([^/]+)', path)
+    match = CONVERSATION_PATH_RE.search(path)
     if not match:
         return None
     conv_id = match.group(1)
     try:
-        from .config import get_api_url, LETTA_API_HEADERS
         url = get_api_url(f"conversations/{conv_id}")
-        resp = requests.get(url, headers=LETTA_API_HEADERS, timeout=10)
+        resp = letta_session.get(url, timeout=LETTA_TIMEOUT)
         if resp.ok:
-            agent_id = resp.json().get("agent_id")
-            print(f"[CONV_RESOLVE] {conv_id} -> {agent_id}")
+            agent_id = response_json(resp).get("agent_id")
+            logger.debug("Resolved conversation %s -> %s", conv_id, agent_id)
             return agent_id
         else:
-            print(f"[CONV_RESOLVE] Failed for {conv_id}: HTTP {resp.status_code}")
+            logger.warning("Conversation lookup failed for %s: HTTP %s", conv_id, resp.status_code)
     except Exception as e:
-        print(f"[CONV_RESOLVE] Error for {conv_id}: {e}")
+        logger.error("Conversation lookup error for %s: %s", conv_id, e)
     return None
 
+def extract_text_from_content(content):
+    """
+    Flatten a message content list into its text, joining the "text" parts with spaces.
+    Plain strings (the common case) and other values are returned unchanged.
+    """
+    if not isinstance(content, list):
+        return content
+    return " ".join(
+        item.get("text", "") for item in content
+        if isinstance(item, dict) and item.get("type") == "text"
+    ).strip()
+
+@lru_cache(maxsize=INTENT_CACHE_SIZE)
 def extract_user_intent(prompt: str) -> str:
     """
     Extract the actual user intent from a prompt by stripping metadata prefixes.
     Handles Matrix message format, OpenCode format, and other wrapper patterns.
+    Results for recently seen prompts are cached.
     """
     if not prompt:
         return ""
     
     cleaned = prompt.strip()
     
-    # Strip <system-reminder> ... </system-reminder> blocks (may appear anywhere)
-    cleaned = re.sub(r'<system-reminder>.*?</system-reminder>', '', cleaned, flags=re.DOTALL)
-    
-    # Strip Matrix prefix: [Matrix: @user:domain in Room Name]
-    matrix_pattern = r'^\[Matrix:[^\]]+\]\s*'
-    cleaned = re.sub(matrix_pattern, '', cleaned, flags=re.IGNORECASE)
-    
-    # Strip OpenCode prefix: [MESSAGE FROM OPENCODE USER] or similar
-    opencode_pattern = r'^\[MESSAGE FROM OPENCODE[^\]]*\]\s*'
-    cleaned = re.sub(opencode_pattern, '', cleaned, flags=re.IGNORECASE)
-    
-    # Strip response instruction blocks at the end
-    response_instruction_pattern = r'---\s*RESPONSE INSTRUCTION.*$'
-    cleaned = re.sub(response_instruction_pattern, '', cleaned, flags=re.DOTALL | re.IGNORECASE)
-    
-    # Strip any remaining XML-like metadata tags (e.g. <context>, <instructions>)
-    cleaned = re.sub(r'<[a-z_-]+>.*?</[a-z_-]+>', '', cleaned, flags=re.DOTALL | re.IGNORECASE)
+    for literal, prefix_only, pattern in INTENT_STRIP_RULES:
+        present = cleaned.startswith(literal) if prefix_only else literal in cleaned
+        if present:
+            cleaned = pattern.sub('', cleaned)
     
     return cleaned.strip()
 
-def should_skip_tool_attachment(prompt: str) -> bool:
+def is_trivial_intent(cleaned: str) -> bool:
     """
-    Determine if tool attachment should be skipped for trivial messages.
-    Returns True if the message is too short/trivial to warrant tool search.
+    Determine if an already-cleaned user intent (see extract_user_intent) is too
+    short/trivial to warrant context generation or tool search.
     """
-    if not prompt:
-        return True
-    
-    cleaned = extract_user_intent(prompt)
-    
     if len(cleaned) < 10:
         return True
     
@@ -179,37 +246,48 @@ def should_skip_tool_attachment(prompt: str) -> bool:
     if word_count < 3:
         return True
     
-    trivial_patterns = [
-        r'^(hi|hello|hey|yo|sup|thanks|thank you|ok|okay|sure|yes|no|maybe|cool|nice|great|awesome|good|bye|goodbye|later|cheers)\b',
-        r'^(how are you|what\'?s up|how\'?s it going)\??$',
-        r'^\W*$',  # Only punctuation/whitespace
-    ]
-    
-    cleaned_lower = cleaned.lower()
-    for pattern in trivial_patterns:
-        if re.match(pattern, cleaned_lower):
-            return True
+    return TRIVIAL_MESSAGE_RE.match(cleaned.lower()) is not None
+
+def should_skip_tool_attachment(prompt: str) -> bool:
+    """
+    Determine if tool attachment should be skipped for trivial messages.
+    Returns True if the message is too short/trivial to warrant tool search.
+    """
+    if not prompt:
+        return True
     
-    return False
+    return is_trivial_intent(extract_user_intent(prompt))
 
 def fetch_recent_episodes(agent_id: str, last_n: int = 3) -> list:
     """Fetch recent episodes, trying claude_conversations first (main group), then agent-specific."""
     for group_id in ["claude_conversations", agent_id]:
         try:
             url = f"{GRAPHITI_API_URL}/episodes/{group_id}"
-            resp = requests.get(url, params={"last_n": last_n}, timeout=10)
+            resp = graphiti_session.get(url, params={"last_n": last_n}, timeout=10)
             resp.raise_for_status()
-            episodes = resp.json().get("episodes", [])
+            episodes = response_json(resp).get("episodes", [])
             if episodes:
-                print(f"[GRAPHITI] Fetched {len(episodes)} recent episodes from group '{group_id}'")
+                logger.info("Fetched %d recent episodes from group '%s'", len(episodes), group_id)
                 return episodes
         except Exception as e:
-            print(f"[GRAPHITI] Episode fetch failed for group '{group_id}': {e}")
+            logger.warning("Episode fetch failed for group '%s': %s", group_id, e)
             continue
-    print(f"[GRAPHITI] No episodes found in any group for agent {agent_id}")
+    logger.info("No episodes found in any group for agent %s", agent_id)
     return []
 
 
+def _graphiti_search(url: str, payload: dict, result_key: str) -> list:
+    """POST one Graphiti search and return its result list, or [] if the search fails."""
+    try:
+        response = graphiti_session.post(url, json=payload, timeout=30)
+        response.raise_for_status()
+        results = response_json(response).get(result_key, [])
+        logger.debug("Got %d raw %s", len(results), result_key)
+        return results
+    except Exception as e:
+        logger.warning("Graphiti %s query failed: %s", result_key, e)
+        return []
+
 def query_graphiti_api(query: str, max_nodes: int = None, max_facts: int = None) -> dict:
     """
     Query the Graphiti search API for context with robust timeout and retry handling.
@@ -226,21 +304,7 @@ def query_graphiti_api(query: str, max_nodes: int = None, max_facts: int = None)
         if not graphiti_url:
             graphiti_url = "http://192.168.50.90:8003"
         
-        # Configure session with retry logic
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504]
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        print(f"[GRAPHITI] Searching with query: '{query[:100]}...'")
-        
-        nodes = []
-        edges = []
+        logger.info("Searching Graphiti with query: '%.100s...'", query)
         
         # Base search config: all 4 methods + RRF fusion
         facts_search_config = {
@@ -265,31 +329,18 @@ def query_graphiti_api(query: str, max_nodes: int = None, max_facts: int = None)
             "similarity_threshold": 0.3,
         }
         
-        # Query facts (edges/relationships)
-        try:
-            facts_url = f"{graphiti_url}/search"
-            facts_payload = {"query": query, "max_facts": max_facts, "config": facts_search_config}
-            print(f"[GRAPHITI] Querying facts with fulltext+similarity+hipporag+bfs")
-            facts_response = session.post(facts_url, json=facts_payload, timeout=30)
-            facts_response.raise_for_status()
-            facts_results = facts_response.json()
-            edges = facts_results.get("facts", [])
-            print(f"[GRAPHITI] Got {len(edges)} raw facts")
-        except Exception as e:
-            print(f"[GRAPHITI] Facts query failed: {e}")
+        # Facts (edges/relationships) and nodes (entities, with community_boost) are
+        # independent searches: the facts query runs on the pool while nodes run here
+        facts_url = f"{graphiti_url}/search"
+        facts_payload = {"query": query, "max_facts": max_facts, "config": facts_search_config}
+        logger.debug("Querying facts with fulltext+similarity+hipporag+bfs")
+        facts_future = _graphiti_pool.submit(_graphiti_search, facts_url, facts_payload, "facts")
         
-        # Query nodes (entities) with community_boost
-        try:
-            nodes_url = f"{graphiti_url}/search/nodes"
-            nodes_payload = {"query": query, "max_nodes": max_nodes, "config": node_search_config}
-            print(f"[GRAPHITI] Querying nodes with fulltext+similarity+hipporag+bfs+community_boost")
-            nodes_response = session.post(nodes_url, json=nodes_payload, timeout=30)
-            nodes_response.raise_for_status()
-            nodes_results = nodes_response.json()
-            nodes = nodes_results.get("nodes", [])
-            print(f"[GRAPHITI] Got {len(nodes)} raw nodes")
-        except Exception as e:
-            print(f"[GRAPHITI] Nodes query failed: {e}")
+        nodes_url = f"{graphiti_url}/search/nodes"
+        nodes_payload = {"query": query, "max_nodes": max_nodes, "config": node_search_config}
+        logger.debug("Querying nodes with fulltext+similarity+hipporag+bfs+community_boost")
+        nodes = _graphiti_search(nodes_url, nodes_payload, "nodes")
+        edges = facts_future.result()
         
         # --- QUALITY FILTERING ---
         
@@ -299,61 +350,54 @@ def query_graphiti_api(query: str, max_nodes: int = None, max_facts: int = None)
         
         # Filter invalidated facts (temporal filtering)
         edges = [e for e in edges if not e.get("invalid_at")]
-        print(f"[GRAPHITI] Facts after filtering: {len(edges)} of {pre_filter_edges} (score>={MIN_FACT_SCORE}, valid only)")
+        logger.debug("Facts after filtering: %d of %d (score>=%s, valid only)", len(edges), pre_filter_edges, MIN_FACT_SCORE)
         
         # Filter nodes by score threshold (only if score is present)
         pre_filter_nodes = len(nodes)
         nodes = [n for n in nodes if n.get("score", MIN_NODE_SCORE) >= MIN_NODE_SCORE]
-        print(f"[GRAPHITI] Nodes after filtering: {len(nodes)} of {pre_filter_nodes} (score>={MIN_NODE_SCORE})")
+        logger.debug("Nodes after filtering: %d of %d (score>=%s)", len(nodes), pre_filter_nodes, MIN_NODE_SCORE)
         
         # --- FORMAT CONTEXT ---
         
-        context_parts = []
-        
-        if nodes:
-            nodes_to_process = nodes[:max_nodes]
-            for node in nodes_to_process:
-                node_name = node.get('name', 'N/A')
-                node_summary = node.get('summary', 'N/A')
-                context_parts.append(f"Node: {node_name}\nSummary: {node_summary}")
+        context_parts = [
+            f"Node: {node.get('name', 'N/A')}\nSummary: {node.get('summary', 'N/A')}"
+            for node in nodes[:max_nodes]
+        ]
         
         if edges:
-            edges_to_process = edges[:max_facts]
-            seen_facts = set()
-            for edge in edges_to_process:
-                fact_text = edge.get('fact', edge.get('name', 'N/A'))
-                if fact_text not in seen_facts and fact_text != 'N/A':
-                    seen_facts.add(fact_text)
-                    context_parts.append(f"Fact: {fact_text}")
-            print(f"[GRAPHITI] After deduplication: {len(seen_facts)} unique facts")
+            # dict.fromkeys drops repeated facts while keeping first-seen order
+            unique_facts = dict.fromkeys(edge.get('fact', edge.get('name', 'N/A')) for edge in edges[:max_facts])
+            unique_facts.pop('N/A', None)
+            context_parts.extend([f"Fact: {fact_text}" for fact_text in unique_facts])
+            logger.debug("After deduplication: %d unique facts", len(unique_facts))
         
         if not context_parts:
             fallback_msg = f"No relevant information found in Graphiti for query: '{query[:80]}'"
-            print(f"[GRAPHITI] No context found after filtering")
+            logger.info("No Graphiti context found after filtering")
             return {"context": fallback_msg, "success": False}
         
         final_context = "Relevant Entities from Knowledge Graph:\n" + "\n\n".join(context_parts)
-        print(f"[GRAPHITI] Generated context: {len(final_context)} chars, {len(nodes)} nodes, {len(edges)} facts")
+        logger.info("Generated Graphiti context: %d chars, %d nodes, %d facts", len(final_context), len(nodes), len(edges))
         
-        session.close()
         return {"context": final_context, "success": True}
         
     except requests.exceptions.RequestException as e:
         error_msg = f"Error querying Graphiti: {e}"
-        print(f"[GRAPHITI] Error: {error_msg}")
+        logger.error("Error querying Graphiti: %s", e)
         return {"context": error_msg, "success": False}
     except Exception as e:
         error_msg = f"An unexpected error occurred during Graphiti context generation: {e}"
-        print(f"[GRAPHITI] Unexpected error: {error_msg}")
+        logger.exception("Unexpected error during Graphiti context generation: %s", e)
         return {"context": error_msg, "success": False}
 
-def generate_context_from_prompt(prompt: str, agent_id: str) -> dict:
-    cleaned_prompt = extract_user_intent(prompt)
+def generate_context_from_prompt(prompt: str, agent_id: str, cleaned_prompt: str | None = None) -> dict:
+    if cleaned_prompt is None:
+        cleaned_prompt = extract_user_intent(prompt)
     if not cleaned_prompt:
         cleaned_prompt = prompt
 
-    print(f"[CONTEXT_GEN] Raw prompt: '{prompt[:100]}...'")
-    print(f"[CONTEXT_GEN] Cleaned prompt: '{cleaned_prompt[:100]}...'")
+    logger.debug("Raw prompt: '%.100s...'", prompt)
+    logger.debug("Cleaned prompt: '%.100s...'", cleaned_prompt)
 
     graphiti_result = query_graphiti_api(cleaned_prompt)
 
@@ -379,6 +423,66 @@ def generate_context_from_prompt(prompt: str, agent_id: str) -> dict:
 
     return graphiti_result
 
+
+def update_available_agents_block(prompt: str, agent_id: str, event_type: str | None) -> None:
+    """Find agents relevant to the prompt and publish them as a memory block."""
+    try:
+        logger.info("Searching for relevant agents for prompt: '%.100s...'", prompt)
+        agent_results = query_agent_registry(query=prompt, limit=10, min_score=0.3)
+
+        if agent_results.get("success") and agent_results.get("agents"):
+            # Create memory block with available agents
+            agent_context = format_agent_context(agent_results)
+            logger.debug("Formatted agent context (%d chars)", len(agent_context))
+            agent_block_data = {
+                "label": f"available_agents_{agent_id}",
+                "value": agent_context,
+                "metadata": {"source": "agent_registry", "event_type": event_type}
+            }
+            logger.debug("Creating available_agents_%s memory block for agent %s", agent_id, agent_id)
+            try:
+                block_result = create_memory_block(agent_block_data, agent_id)
+                logger.debug("Agent block creation result: %s", block_result.get('id') if block_result else None)
+            except Exception as block_err:
+                logger.error("Error creating available agents block: %s", block_err)
+            logger.info("Found %d relevant agents", len(agent_results['agents']))
+        else:
+            logger.info("No relevant agents found or query failed")
+    except Exception as e:
+        logger.error("Error during agent discovery: %s", e)
+        # Don't fail the whole webhook if agent discovery fails
+
+
+def attach_relevant_tools(cleaned_prompt: str, agent_id: str) -> dict | None:
+    """Find and attach tools relevant to the prompt, returning the structured result."""
+    tool_attachment_data = None
+    try:
+        logger.info("Searching for tools with cleaned prompt: '%.100s...'", cleaned_prompt)
+
+        find_tools_id = get_find_tools_id_with_fallback(agent_id=agent_id)
+        keep_tools_str = ",".join(["*", find_tools_id, *PROTECTED_TOOL_NAMES])
+
+        tool_attachment_data = find_attach_tools(
+            query=cleaned_prompt,
+            agent_id=agent_id,
+            keep_tools=keep_tools_str,
+            limit=TOOL_ATTACHMENT_LIMIT,
+            min_score=TOOL_ATTACHMENT_MIN_SCORE,
+            request_heartbeat=False,
+            return_structured=True
+        )
+        # Check for fail-closed abort from wildcard expansion
+        if isinstance(tool_attachment_data, dict) and tool_attachment_data.get('error') == 'wildcard_expansion_failed':
+            logger.warning("Tool attachment aborted: %s", tool_attachment_data.get('message', 'wildcard expansion failed'))
+            tool_attachment_data = None  # Treat as no-op, existing tools preserved
+        else:
+            logger.info("Tool attachment result: %s", tool_attachment_data)
+    except Exception as e:
+        logger.error("Error during tool attachment: %s", e)
+        # Don't fail the whole webhook if tool attachment fails
+    return tool_attachment_data
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """
@@ -394,146 +498,94 @@ def webhook_receiver():
     Supports both /webhook and /webhook/letta endpoints for compatibility.
     """
     try:
-        data = request.json
+        # Parsed once; a missing, malformed or non-JSON body yields None instead of raising
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            logger.warning("Webhook body is not a JSON object (Content-Type: %s)", request.content_type)
+            return jsonify({"error": "Webhook body must be a JSON object."}), 400
         
-        # DEBUG: Log the incoming webhook data
-        print(f"\n[WEBHOOK_DEBUG] Received webhook data:")
-        print(f"[WEBHOOK_DEBUG] Full JSON: {json.dumps(data, indent=2)}")
+        # DEBUG: Log the incoming webhook data; pretty-printing the whole payload is
+        # skipped entirely unless DEBUG is enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received webhook data: %s", dumps_pretty(data))
         
         event_type = data.get("type")
         agent_id = None
         prompt = None
 
         if event_type in ("message_sent", "stream_started"):
+            # Nested request/response sections, looked up once
+            request_data = data.get("request") or {}
+            response_data = data.get("response")
+            
             prompt = data.get("prompt")
-            if not prompt and data.get("request") and data["request"].get("body"):
-                prompt = data["request"]["body"].get("input", "")
+            if not prompt and request_data.get("body"):
+                prompt = request_data["body"].get("input", "")
             
-            if data.get("response"):
-                agent_id = data["response"].get("agent_id")
+            if response_data:
+                agent_id = response_data.get("agent_id")
             
-            if not agent_id and data.get("request") and data["request"].get("path"):
-                path = data["request"]["path"]
-                if "/agents/" in path:
-                    path_parts = path.split("/")
-                    if "agents" in path_parts:
-                        agent_idx = path_parts.index("agents") + 1
-                        if agent_idx < len(path_parts):
-                            potential_agent_id = path_parts[agent_idx]
-                            if potential_agent_id.startswith("agent-"):
-                                agent_id = potential_agent_id
+            path = request_data.get("path")
+            if not agent_id and path:
+                agent_match = AGENT_PATH_RE.search(path)
+                if agent_match:
+                    if agent_match.group(1).startswith("agent-"):
+                        agent_id = agent_match.group(1)
                 elif "/conversations/" in path:
                     agent_id = resolve_agent_from_conversation(path)
 
         # Extract text from prompt if it's a list of objects
-        if isinstance(prompt, list):
-            prompt_text = ""
-            for item in prompt:
-                if isinstance(item, dict) and item.get("type") == "text":
-                    prompt_text += item.get("text", "") + " "
-            prompt = prompt_text.strip()
+        prompt = extract_text_from_content(prompt)
 
         # DEBUG: Log extracted values
-        print(f"[WEBHOOK_DEBUG] Extracted values:")
-        print(f"[WEBHOOK_DEBUG]   Event type: {event_type}")
-        print(f"[WEBHOOK_DEBUG]   Agent ID: {agent_id}")
-        print(f"[WEBHOOK_DEBUG]   Prompt: {prompt}")
+        logger.debug("Extracted event type: %s, agent ID: %s, prompt: %s", event_type, agent_id, prompt)
         
         # Track agent for Matrix notifications
         if agent_id:
             track_agent_and_notify(agent_id)
 
         if not agent_id or not prompt:
-            print(f"[WEBHOOK_DEBUG] Missing agent_id or prompt - returning 400")
+            logger.warning("Missing agent_id or prompt; returning 400")
             return jsonify({"error": "Could not extract agent_id or prompt from webhook."}), 400
 
-        # Skip context generation for trivial messages (reuse tool attachment skip logic)
-        if should_skip_tool_attachment(prompt):
-            print(f"[CONTEXT_GEN] Skipping context generation - trivial message detected")
+        # Normalize the prompt once; context generation and tool attachment share it
+        cleaned_prompt = extract_user_intent(prompt)
+        is_trivial = is_trivial_intent(cleaned_prompt)
+
+        # Agent discovery and tool attachment don't depend on the Graphiti context,
+        # so they run on the stage pool while context generation runs here
+        agents_future = _webhook_stage_pool.submit(update_available_agents_block, prompt, agent_id, event_type)
+        if is_trivial:
+            logger.info("Skipping tool attachment: trivial message detected")
+            tools_future = None
         else:
-            # Generate context based on the prompt
-            context_result = generate_context_from_prompt(prompt, agent_id)
-            
-            # Create or update the memory block with the new context (agent-specific)
-            if context_result.get("success"):
-                block_data = {
-                    "label": f"graphiti_context_{agent_id}",
-                    "value": context_result.get("context", ""),
-                    "metadata": {"source": "webhook", "event_type": event_type}
-                }
-                create_memory_block(block_data, agent_id)
-            else:
-                print(f"[CONTEXT_GEN] Skipping memory block update - no useful context generated")
+            tools_future = _webhook_stage_pool.submit(attach_relevant_tools, cleaned_prompt, agent_id)
 
-        # Agent discovery - find relevant agents for collaboration
         try:
-            print(f"[AGENT_DISCOVERY] Searching for relevant agents for prompt: '{prompt[:100]}...'")
-            agent_results = query_agent_registry(query=prompt, limit=10, min_score=0.3)
-            
-            if agent_results.get("success") and agent_results.get("agents"):
-                # Create memory block with available agents
-                agent_context = format_agent_context(agent_results)
-                print(f"[AGENT_DISCOVERY] Formatted agent context ({len(agent_context)} chars)")
-                agent_block_data = {
-                    "label": f"available_agents_{agent_id}",
-                    "value": agent_context,
-                    "metadata": {"source": "agent_registry", "event_type": event_type}
-                }
-                print(f"[AGENT_DISCOVERY] Creating available_agents_{agent_id} memory block for agent {agent_id}")
-                try:
-                    block_result = create_memory_block(agent_block_data, agent_id)
-                    print(f"[AGENT_DISCOVERY] Block creation result: {block_result.get('id') if block_result else 'None'}")
-                except Exception as block_err:
-                    print(f"[AGENT_DISCOVERY] Error creating block: {block_err}")
-                print(f"[AGENT_DISCOVERY] Found {len(agent_results['agents'])} relevant agents")
+            # Skip context generation for trivial messages (reuse tool attachment skip logic)
+            if is_trivial:
+                logger.info("Skipping context generation: trivial message detected")
             else:
-                print(f"[AGENT_DISCOVERY] No relevant agents found or query failed")
-        except Exception as e:
-            print(f"[AGENT_DISCOVERY] Error during agent discovery: {e}")
-            # Don't fail the whole webhook if agent discovery fails
-
-        # Auto tool attachment - find and attach relevant tools based on the prompt
-        tool_attachment_data = None
-        
-        if should_skip_tool_attachment(prompt):
-            print(f"[AUTO_TOOL_ATTACHMENT] Skipping - trivial message detected")
-        else:
-            try:
-                cleaned_prompt = extract_user_intent(prompt)
-                print(f"[AUTO_TOOL_ATTACHMENT] Searching for tools with cleaned prompt: '{cleaned_prompt[:100]}...'")
-                
-                find_tools_id = get_find_tools_id_with_fallback(agent_id=agent_id)
-                keep_tools_list = ["*", find_tools_id]
-
-                # Protection is handled by the toolselector's NEVER_DETACH_TOOLS.
-                # Local PROTECTED_TOOLS is kept as optional fallback only.
-                from .config import PROTECTED_TOOLS
-                if PROTECTED_TOOLS:
-                    keep_tools_list.extend([t.strip() for t in PROTECTED_TOOLS.split(',') if t.strip()])
-
-                keep_tools_str = ",".join(keep_tools_list)
-                
-                from .config import TOOL_ATTACHMENT_MIN_SCORE, TOOL_ATTACHMENT_LIMIT
-                
-                tool_attachment_data = find_attach_tools(
-                    query=cleaned_prompt,
-                    agent_id=agent_id,
-                    keep_tools=keep_tools_str,
-                    limit=TOOL_ATTACHMENT_LIMIT,
-                    min_score=TOOL_ATTACHMENT_MIN_SCORE,
-                    request_heartbeat=False,
-                    return_structured=True
-                )
-                # Check for fail-closed abort from wildcard expansion
-                if isinstance(tool_attachment_data, dict) and tool_attachment_data.get('error') == 'wildcard_expansion_failed':
-                    print(f"[AUTO_TOOL_ATTACHMENT] ABORTED: {tool_attachment_data.get('message', 'wildcard expansion failed')}")
-                    tool_attachment_data = None  # Treat as no-op, existing tools preserved
+                # Generate context based on the prompt
+                context_result = generate_context_from_prompt(prompt, agent_id, cleaned_prompt)
+            
+                # Create or update the memory block with the new context (agent-specific)
+                if context_result.get("success"):
+                    block_data = {
+                        "label": f"graphiti_context_{agent_id}",
+                        "value": context_result.get("context", ""),
+                        "metadata": {"source": "webhook", "event_type": event_type}
+                    }
+                    create_memory_block(block_data, agent_id)
                 else:
-                    print(f"[AUTO_TOOL_ATTACHMENT] Tool attachment result: {tool_attachment_data}")
-            except Exception as e:
-                print(f"[AUTO_TOOL_ATTACHMENT] Error during tool attachment: {e}")
-            # Don't fail the whole webhook if tool attachment fails
-        
+                    logger.info("Skipping memory block update: no useful context generated")
+        finally:
+            # Join the background stages before responding, also when context generation
+            # fails, so no stage keeps running after the response is sent
+            agents_future.result()
+            if tools_future:
+                tools_future.result()
+
         # REMOVED: Tool inventory memory block - no longer needed
         # Agents can now discover available tools via find_tools protected tool
         # try:
@@ -562,7 +614,7 @@ def webhook_receiver():
         return jsonify({"status": "success", "message": "Context processed and tools attached"}), 200
 
     except Exception as e:
-        print(f"[ERROR] {e}")
+        logger.exception("Error processing webhook: %s", e)
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
@@ -571,4 +623,5 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=5005, help="Port to listen on")
     args = parser.parse_args()
 
+    configure_logging()
     app.run(host=args.host, port=args.port)
\ No newline at end of file
@@ -1,8 +1,91 @@
+import logging
 import requests
-import json
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from .config import LETTA_API_HEADERS, get_api_url
+from .cache import TTLCache
+from .config import get_api_url
+from .executors import DaemonThreadPool
+from .http_client import LETTA_TIMEOUT, letta_session
+from .json_utils import response_json
+
+logger = logging.getLogger(__name__)
+
+# Runs the speculative global-block lookup alongside the attached-block lookup
+_lookup_pool = DaemonThreadPool(max_workers=8, thread_name_prefix="block-lookup")
+
+# Global block ids per label; the same few blocks come back on every webhook. As with
+# attached blocks, values are not cached: a hit reads the block itself.
+GLOBAL_BLOCKS_CACHE_TTL = 60
+_global_blocks_cache = TTLCache(maxsize=32, ttl=GLOBAL_BLOCKS_CACHE_TTL)
+
+# Attached block ids per agent, keyed by label. Only ids are cached, never values:
+# the agent (or another process) can edit a block at any time, so the block itself
+# is read fresh before its value is used to build an update.
+ATTACHED_BLOCKS_CACHE_TTL = 10
+_attached_blocks_cache = TTLCache(maxsize=1024, ttl=ATTACHED_BLOCKS_CACHE_TTL)
+
+# Labels last seen attached to each agent. Kept far longer than the id manifest, since
+# it is only a hint: it decides whether a cold lookup starts the speculative global
+# search, and a stale hint costs at most one extra or one serialized round-trip.
+ATTACHED_LABELS_TTL = 3600
+_attached_labels_cache = TTLCache(maxsize=1024, ttl=ATTACHED_LABELS_TTL)
+
+def _extract_blocks(response_data) -> List[dict]:
+    """Normalize a Letta blocks response, which may be a bare list or {"blocks": [...]}."""
+    if isinstance(response_data, list):
+        return response_data
+    return response_data.get("blocks", [])
+
+def _get_block(block_id: str) -> dict:
+    """Fetch a single block by id."""
+    block_url = get_api_url(f"blocks/{block_id}")
+
+    block_response = letta_session.get(block_url, timeout=LETTA_TIMEOUT)
+    block_response.raise_for_status()
+    return response_json(block_response)
+
+def _fetch_attached_blocks(agent_id: str) -> Dict[str, dict]:
+    """Fetch an agent's attached core-memory blocks by label and cache their ids."""
+    agent_blocks_url = get_api_url(f"agents/{agent_id}/core-memory/blocks")
+
+    agent_blocks_response = letta_session.get(agent_blocks_url, timeout=LETTA_TIMEOUT)
+    agent_blocks_response.raise_for_status()
+
+    attached_blocks = _extract_blocks(response_json(agent_blocks_response))
+    logger.debug("Fetched %d attached blocks for agent %s", len(attached_blocks), agent_id)
+    # The first block with a label wins, as it did when the list was scanned in order
+    blocks_by_label = {}
+    for block in attached_blocks:
+        blocks_by_label.setdefault(block.get("label"), block)
+    _attached_blocks_cache.set(agent_id, {label: block.get("id") for label, block in blocks_by_label.items()})
+    _attached_labels_cache.set(agent_id, frozenset(blocks_by_label))
+    return blocks_by_label
+
+def _find_global_block(block_label: str) -> Optional[dict]:
+    """Return the first global (non-template) block carrying the given label, or None."""
+    cached_ids = _global_blocks_cache.get(block_label)
+    if cached_ids is not None:
+        # Only the id is cached; read the block so its value is current
+        return _get_block(cached_ids[0]) if cached_ids else None
+
+    global_blocks_url = get_api_url("blocks")
+    params = {"label": block_label, "templates_only": "false"}
+
+    global_blocks_response = letta_session.get(global_blocks_url, params=params, timeout=LETTA_TIMEOUT)
+    global_blocks_response.raise_for_status()
+
+    global_blocks = _extract_blocks(response_json(global_blocks_response))
+    logger.debug("Fetched %d global '%s' blocks", len(global_blocks), block_label)
+    _global_blocks_cache.set(block_label, tuple(block.get("id") for block in global_blocks))
+    return global_blocks[0] if global_blocks else None
+
+def invalidate_global_blocks(block_label: str) -> None:
+    """Forget cached global block ids for a label, e.g. after a new block with it is created."""
+    _global_blocks_cache.pop(block_label)
+
+def invalidate_attached_blocks(agent_id: str) -> None:
+    """Forget an agent's cached attached block ids, e.g. after a block is attached to it."""
+    _attached_blocks_cache.pop(agent_id)
 
 def find_memory_block(agent_id: str, block_label: str) -> Tuple[Optional[dict], bool]:
     """
@@ -17,54 +100,48 @@ def find_memory_block(agent_id: str, block_label: str) -> Tuple[Optional[dict],
         block is attached to the agent, or (None, False) if not found.
     """
     if not agent_id:
-        print(f"[find_memory_block] No agent_id provided for label '{block_label}'.")
+        logger.warning("No agent_id provided for label '%s'.", block_label)
         return None, False
 
     try:
-        # Stage 1: Check blocks attached to the agent
-        agent_blocks_url = get_api_url(f"agents/{agent_id}/core-memory/blocks")
-        request_headers = {**LETTA_API_HEADERS}
-        
-        agent_blocks_response = requests.get(agent_blocks_url, headers=request_headers, timeout=10)
-        agent_blocks_response.raise_for_status()
-        
-        response_data = agent_blocks_response.json()
-        
-        # Handle case where response might be a list or a dict
-        if isinstance(response_data, list):
-            attached_blocks = response_data
+        # Stage 1: Check blocks attached to the agent. With a warm id manifest the
+        # answer is known immediately, so Stage 2 only runs for labels actually missing.
+        global_future = None
+        attached_ids = _attached_blocks_cache.get(agent_id)
+        if attached_ids is None:
+            # Cold manifest: start Stage 2 up front so a Stage 1 miss costs one round-trip
+            # instead of two, unless the label is known to be attached (the common case
+            # once an agent has been seen) or its global ids are cached anyway
+            known_labels = _attached_labels_cache.get(agent_id, frozenset())
+            if block_label not in known_labels and _global_blocks_cache.get(block_label) is None:
+                global_future = _lookup_pool.submit(_find_global_block, block_label)
+            block = _fetch_attached_blocks(agent_id).get(block_label)
         else:
-            attached_blocks = response_data.get("blocks", [])
-        for block in attached_blocks:
-            if block.get("label") == block_label:
-                print(f"[find_memory_block] Found attached '{block_label}' block (ID: {block.get('id')}).")
-                return block, True
+            # Only the id is cached; read the block so its value is current
+            block_id = attached_ids.get(block_label)
+            block = _get_block(block_id) if block_id else None
+
+        if block is not None:
+            if global_future is not None:
+                global_future.cancel()
+            logger.debug("Found attached '%s' block (ID: %s).", block_label, block.get("id"))
+            return block, True
 
         # Stage 2: Check global blocks
-        global_blocks_url = get_api_url("blocks")
-        params = {"label": block_label, "templates_only": "false"}
-        
-        global_blocks_response = requests.get(global_blocks_url, headers=LETTA_API_HEADERS, params=params, timeout=10)
-        global_blocks_response.raise_for_status()
-        
-        response_data = global_blocks_response.json()
-        
-        # Handle case where response might be a list or a dict
-        if isinstance(response_data, list):
-            global_blocks = response_data
-        else:
-            global_blocks = response_data.get("blocks", [])
-        if global_blocks:
-            block = global_blocks[0]
-            print(f"[find_memory_block] Found global '{block_label}' block (ID: {block.get('id')}).")
+        block = global_future.result() if global_future is not None else _find_global_block(block_label)
+        if block is not None:
+            logger.info("Found global '%s' block (ID: %s).", block_label, block.get("id"))
             return block, False
 
-        print(f"[find_memory_block] No '{block_label}' block found for agent {agent_id}.")
+        logger.info("No '%s' block found for agent %s.", block_label, agent_id)
         return None, False
 
     except requests.exceptions.RequestException as e:
-        print(f"[find_memory_block] API Error for agent {agent_id} and label '{block_label}': {e}")
+        logger.error("API error for agent %s and label '%s': %s", agent_id, block_label, e)
+        # A cached id may point at a block that was deleted or detached meanwhile
+        invalidate_attached_blocks(agent_id)
+        invalidate_global_blocks(block_label)
         return None, False
     except Exception as e:
-        print(f"[find_memory_block] Unexpected error for agent {agent_id} and label '{block_label}': {e}")
-        return None, False
\ No newline at end of file
+        logger.exception("Unexpected error for agent %s and label '%s': %s", agent_id, block_label, e)
+        return None, False
@@ -10,6 +10,16 @@ LETTA_API_HEADERS = {
     "Authorization": f"Bearer {LETTA_PASSWORD}"
 }
 
+# Bearer-only headers for the Letta agent and tool lookups, which send Authorization
+# only when LETTA_PASSWORD is actually set
+LETTA_API_KEY = os.environ.get("LETTA_PASSWORD")
+LETTA_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+}
+if LETTA_API_KEY:
+    LETTA_HEADERS["Authorization"] = f"Bearer {LETTA_API_KEY}"
+
 # Graphiti configuration
 GRAPHITI_API_URL = os.environ.get("GRAPHITI_URL", "http://192.168.50.90:8001/api")
 GRAPHITI_MAX_NODES = int(os.environ.get("GRAPHITI_MAX_NODES", "8"))
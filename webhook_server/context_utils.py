@@ -1,20 +1,60 @@
 from typing import List, Dict
+import logging
 import re
+import time
 from datetime import datetime, UTC
 
+logger = logging.getLogger(__name__)
+
 # Maximum context snippet length for cumulative context
 # Letta now supports 20K char blocks. Using 8000 to keep context useful without bloat.
 MAX_CONTEXT_SNIPPET_LENGTH = 8000
 
+# Context entry separators, compiled once since they run on every context append
+CONTEXT_ENTRY_SPLIT_RE = re.compile(r'\n\n--- CONTEXT ENTRY \(([^)]+)\) ---\n\n')
+CONTEXT_ENTRY_TIMESTAMP_RE = re.compile(r'--- CONTEXT ENTRY \(([^)]+)\) ---')
+TRAILING_ENTRY_SEPARATOR_RE = re.compile(r'\n\n--- CONTEXT ENTRY \([^)]+\) ---\n\n\s*\Z')
+
+# Headings that identify arXiv and Graphiti content, matched together in one scan
+CONTENT_SENTINEL_RE = re.compile(
+    r'(\*\*Recent Research Papers \(arXiv\)\*\*)|(Relevant Entities from Knowledge Graph:)'
+)
+_ARXIV_CONTENT = 1
+_GRAPHITI_CONTENT = 2
+
+# Markers written into truncated cumulative context
+TRUNCATION_NOTICE = "--- OLDER ENTRIES TRUNCATED ---"
+CONTENT_TRUNCATED_MARKER = "\n\n[CONTENT TRUNCATED]"
+
+# (epoch second, formatted timestamp) of the last entry; replaced as one tuple so
+# concurrent readers never see a mismatched pair
+_timestamp_cache = (0, "")
+
+def _now_utc_str() -> str:
+    """Current UTC time as an entry timestamp, formatted at most once per second."""
+    global _timestamp_cache
+    now = int(time.time())
+    cached_second, cached_str = _timestamp_cache
+    if cached_second != now:
+        cached_str = datetime.fromtimestamp(now, UTC).strftime("%Y-%m-%d %H:%M:%S UTC")
+        _timestamp_cache = (now, cached_str)
+    return cached_str
+
+def _entry_separator(timestamp: str) -> str:
+    """Separator line that introduces a timestamped context entry."""
+    return f"\n\n--- CONTEXT ENTRY ({timestamp}) ---\n\n"
+
+def _format_entry(entry: Dict[str, str]) -> str:
+    """Render a parsed entry back to text; legacy entries carry no separator."""
+    if entry["timestamp"] == "Legacy":
+        return entry["content"]
+    return _entry_separator(entry["timestamp"]) + entry["content"]
+
 def _build_cumulative_context(existing_context: str, new_context: str) -> str:
     """
     Build cumulative context by appending new context to existing context.
     Implements deduplication and truncation logic.
     """
-    # Create timestamp separator for new entry
-    timestamp = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S UTC")
-    separator = f"\n\n--- CONTEXT ENTRY ({timestamp}) ---\n\n"
-    
     # Handle empty existing context
     if not existing_context or existing_context.strip() == "":
         return new_context
@@ -23,49 +63,83 @@ def _build_cumulative_context(existing_context: str, new_context: str) -> str:
     if not new_context or new_context.strip() == "":
         return existing_context
     
+    # Identical repost of the most recent entry: detected from the tail alone, without
+    # parsing the whole existing context
+    if _repeats_latest_entry(existing_context, new_context):
+        logger.debug("New context repeats the most recent entry, skipping append.")
+        return existing_context
+    
+    # Create timestamp separator for new entry
+    separator = _entry_separator(_now_utc_str())
+    
     # Simple deduplication: check if new context is substantially similar to the most recent entry
     existing_entries = _parse_context_entries(existing_context)
     if existing_entries:
         most_recent_entry = existing_entries[-1]["content"]
         if _is_content_similar_with_query_awareness(most_recent_entry, new_context):
-            print("[_build_cumulative_context] New context is similar to most recent entry, skipping append.")
+            logger.debug("New context is similar to most recent entry, skipping append.")
             return existing_context
     
-    # Build new cumulative context
-    cumulative_context = existing_context + separator + new_context
-    
-    # Truncate if exceeds maximum length
-    if len(cumulative_context) > MAX_CONTEXT_SNIPPET_LENGTH:
-        cumulative_context = _truncate_oldest_entries(cumulative_context, MAX_CONTEXT_SNIPPET_LENGTH)
+    # Build new cumulative context. The combined length is known up front, so the full
+    # concatenation is only materialized when it will be kept as-is.
+    cumulative_length = len(existing_context) + len(separator) + len(new_context)
+    if cumulative_length <= MAX_CONTEXT_SNIPPET_LENGTH:
+        cumulative_context = existing_context + separator + new_context
+    else:
+        # Truncate from the parsed entries: reuse the ones already parsed for
+        # deduplication; only the new tail needs parsing
+        entries = existing_entries + _parse_context_entries(separator + new_context)
+        if entries:
+            cumulative_context = _truncate_entries(entries, MAX_CONTEXT_SNIPPET_LENGTH)
+        else:
+            # If we can't parse entries, just truncate from the beginning
+            cumulative_context = (existing_context + separator + new_context)[-MAX_CONTEXT_SNIPPET_LENGTH:]
         
         # CRITICAL FIX: Ensure new content is included even after truncation
         # If the result is just the truncation notice, append the new content
-        if cumulative_context.strip() == "--- OLDER ENTRIES TRUNCATED ---":
-            print("[_build_cumulative_context] TRUNCATION FIX: Adding new content after truncation notice")
-            cumulative_context = "--- OLDER ENTRIES TRUNCATED ---" + separator + new_context
+        if cumulative_context.strip() == TRUNCATION_NOTICE:
+            logger.info("Truncation left only the notice; adding new content after it")
+            cumulative_context = TRUNCATION_NOTICE + separator + new_context
             
             # If still too long, truncate the new content but keep some of it
             if len(cumulative_context) > MAX_CONTEXT_SNIPPET_LENGTH:
-                available_space = MAX_CONTEXT_SNIPPET_LENGTH - len("--- OLDER ENTRIES TRUNCATED ---") - len(separator) - 100  # Leave some buffer
+                available_space = MAX_CONTEXT_SNIPPET_LENGTH - len(TRUNCATION_NOTICE) - len(separator) - 100  # Leave some buffer
                 if available_space > 500:  # Only truncate if we have reasonable space
-                    truncated_new_content = new_context[:available_space] + "\n\n[CONTENT TRUNCATED]"
-                    cumulative_context = "--- OLDER ENTRIES TRUNCATED ---" + separator + truncated_new_content
+                    truncated_new_content = new_context[:available_space] + CONTENT_TRUNCATED_MARKER
+                    cumulative_context = TRUNCATION_NOTICE + separator + truncated_new_content
                 else:
                     # If no reasonable space, just return the new content
                     cumulative_context = new_context
     
     return cumulative_context
 
+def _repeats_latest_entry(existing_context: str, new_context: str) -> bool:
+    """
+    Cheap check for whether new_context is exactly the most recent entry of existing_context.
+    Only the tail of existing_context is compared. Graphiti results are never treated as
+    repeats here, since identical Graphiti searches are still appended.
+    """
+    new_stripped = new_context.strip()
+    existing_stripped = existing_context.rstrip()
+    if not existing_stripped.endswith(new_stripped) or "--- CONTEXT ENTRY (" in new_stripped:
+        return False
+    if _classify_content(new_stripped) & _GRAPHITI_CONTENT:
+        return False
+    
+    # The match must be the whole entry: either all of the context, or everything after
+    # the last entry separator
+    head = existing_stripped[:len(existing_stripped) - len(new_stripped)]
+    if not head or head.isspace():
+        return True
+    return TRAILING_ENTRY_SEPARATOR_RE.search(head[-256:]) is not None
+
 def _parse_context_entries(context: str) -> List[Dict[str, str]]:
     """
     Parse context string into individual entries with timestamps.
     Returns list of dicts with 'timestamp' and 'content' keys.
     """
-    # Pattern to match context entry separators
-    separator_pattern = r'\n\n--- CONTEXT ENTRY \(([^)]+)\) ---\n\n'
-    
     # Split by separators
-    parts = re.split(separator_pattern, context)
+    parts = CONTEXT_ENTRY_SPLIT_RE.split(context)
     
     entries = []
     if len(parts) >= 1:
@@ -90,6 +164,15 @@ def _parse_context_entries(context: str) -> List[Dict[str, str]]:
     
     return entries
 
+def _classify_content(content: str) -> int:
+    """Return a bitfield of the content kinds (arXiv, Graphiti) present, scanning content once."""
+    kinds = 0
+    for match in CONTENT_SENTINEL_RE.finditer(content):
+        kinds |= _ARXIV_CONTENT if match.group(1) else _GRAPHITI_CONTENT
+        if kinds == _ARXIV_CONTENT | _GRAPHITI_CONTENT:
+            break
+    return kinds
+
 def _is_content_similar_with_query_awareness(content1: str, content2: str) -> bool:
     """
     Check if content is similar, but with special handling for arXiv and Graphiti content
@@ -98,8 +181,12 @@ def _is_content_similar_with_query_awareness(content1: str, content2: str) -> bo
     if not content1 or not content2:
         return False
     
+    # Content kinds present in both sides; the existing entry is only scanned if the new one matched
+    new_kinds = _classify_content(content2)
+    shared_kinds = new_kinds & _classify_content(content1) if new_kinds else 0
+    
     # For arXiv content, check if the queries are different
-    if "**Recent Research Papers (arXiv)**" in content1 and "**Recent Research Papers (arXiv)**" in content2:
+    if shared_kinds & _ARXIV_CONTENT:
         # Extract the query lines from both contents
         def extract_arxiv_query(content):
             lines = content.split('\n')
@@ -114,23 +201,20 @@ def _is_content_similar_with_query_awareness(content1: str, content2: str) -> bo
         query2 = extract_arxiv_query(content2)
         
         if query1 and query2 and query1 != query2:
-            print(f"[_is_content_similar_with_query_awareness] Different arXiv queries detected:")
-            print(f"  Query 1: {query1}")
-            print(f"  Query 2: {query2}")
-            print(f"  Treating as different content even if papers overlap.")
+            logger.debug("Different arXiv queries (%r vs %r); treating as different content even if papers overlap.",
+                         query1, query2)
             return False
         elif query1 and query2 and query1 == query2:
-            print(f"[_is_content_similar_with_query_awareness] Same arXiv query detected: {query1}")
+            logger.debug("Same arXiv query detected: %r", query1)
             # Fall through to regular similarity check
     
     # For Graphiti content, check if we have different context entries with timestamps
-    if "Relevant Entities from Knowledge Graph:" in content1 and "Relevant Entities from Knowledge Graph:" in content2:
+    if shared_kinds & _GRAPHITI_CONTENT:
         # Look for timestamp patterns that indicate different search contexts
         
         # Extract timestamps from context entries
-        timestamp_pattern = r'--- CONTEXT ENTRY \(([^)]+)\) ---'
-        timestamps1 = re.findall(timestamp_pattern, content1)
-        timestamps2 = re.findall(timestamp_pattern, content2)
+        timestamps1 = CONTEXT_ENTRY_TIMESTAMP_RE.findall(content1)
+        timestamps2 = CONTEXT_ENTRY_TIMESTAMP_RE.findall(content2)
         
         # If we have different timestamps, these are different searches
         if timestamps1 and timestamps2:
@@ -138,17 +222,14 @@ def _is_content_similar_with_query_awareness(content1: str, content2: str) -> bo
             latest2 = timestamps2[-1] if timestamps2 else None
             
             if latest1 != latest2:
-                print(f"[_is_content_similar_with_query_awareness] Different Graphiti search contexts detected:")
-                print(f"  Latest timestamp 1: {latest1}")
-                print(f"  Latest timestamp 2: {latest2}")
-                print(f"  Treating as different content.")
+                logger.debug("Different Graphiti search contexts (%s vs %s); treating as different content.",
+                             latest1, latest2)
                 return False
         
         # If no timestamps found in content2 (the new content), it's a fresh search result
         # that should be appended regardless of similarity
         if not timestamps2:
-            print(f"[_is_content_similar_with_query_awareness] New Graphiti search result (no timestamp in new content).")
-            print(f"  Treating as different content - will append.")
+            logger.debug("New Graphiti search result (no timestamp in new content); treating as different content.")
             return False
     
     # For non-arXiv/non-Graphiti content or same queries, use regular similarity logic
@@ -162,26 +243,49 @@ def _is_content_similar(content1: str, content2: str) -> bool:
     if not content1 or not content2:
         return False
     
-    # Simple checks for exact or near-exact duplicates
-    content1_clean = content1.strip().lower()
-    content2_clean = content2.strip().lower()
-    
-    # Exact match
-    if content1_clean == content2_clean:
+    # Identical strings (the same object or equal text) need no stripping or lowercasing
+    if content1 == content2:
         return True
     
+    # Simple checks for exact or near-exact duplicates. Lowercasing is deferred for
+    # ASCII text: it never changes an ASCII string's length, so the length checks can
+    # run on the stripped originals and full lowercase copies are made only when needed.
+    content1_clean = content1.strip()
+    content2_clean = content2.strip()
+    ascii_only = content1_clean.isascii() and content2_clean.isascii()
+    if not ascii_only:
+        content1_clean = content1_clean.lower()
+        content2_clean = content2_clean.lower()
+    
     # Check if one is contained within the other (80% threshold)
     shorter_len = min(len(content1_clean), len(content2_clean))
     longer_len = max(len(content1_clean), len(content2_clean))
     
+    # Exact match
+    if shorter_len == longer_len and (
+        content1_clean == content2_clean
+        or (ascii_only and content1_clean.lower() == content2_clean.lower())
+    ):
+        return True
+    
     if shorter_len > 0 and longer_len > 0:
         # If one is much shorter, check containment
         if shorter_len / longer_len < 0.8:
+            if ascii_only:
+                content1_clean = content1_clean.lower()
+                content2_clean = content2_clean.lower()
             return content1_clean in content2_clean or content2_clean in content1_clean
         
-        # For similar length strings, check character overlap
-        common_chars = len(set(content1_clean) & set(content2_clean))
-        total_unique_chars = len(set(content1_clean) | set(content2_clean))
+        # For similar length strings, check character overlap. Each character set is
+        # built once and the union size derived from the intersection (|A|+|B|-|A&B|).
+        # Lowercasing the few distinct characters is cheaper than the whole string.
+        chars1 = set(content1_clean)
+        chars2 = set(content2_clean)
+        if ascii_only:
+            chars1 = {c.lower() for c in chars1}
+            chars2 = {c.lower() for c in chars2}
+        common_chars = len(chars1 & chars2)
+        total_unique_chars = len(chars1) + len(chars2) - common_chars
         
         if total_unique_chars > 0:
             similarity_ratio = common_chars / total_unique_chars
@@ -202,58 +306,62 @@ def _truncate_oldest_entries(context: str, max_length: int) -> str:
         # If we can't parse entries, just truncate from the beginning
         return context[-max_length:]
     
+    return _truncate_entries(entries, max_length)
+
+def _truncate_entries(entries: List[Dict[str, str]], max_length: int) -> str:
+    """
+    Render the most recent of the parsed entries that fit within max_length.
+    Works from the entries alone, so callers need not build the full context string first;
+    callers decide how to fall back when nothing could be parsed.
+    """
+    if not entries:
+        # Nothing was parsed, so there is nothing to keep
+        return ""
+
     # Always try to preserve the most recent entry (which should be the new content)
-    if len(entries) > 0:
-        most_recent_entry = entries[-1]
-        
-        # Format the most recent entry
-        if most_recent_entry["timestamp"] == "Legacy":
-            recent_formatted = most_recent_entry["content"]
-        else:
-            recent_formatted = f"\n\n--- CONTEXT ENTRY ({most_recent_entry['timestamp']}) ---\n\n{most_recent_entry['content']}"
-        
-        # If the most recent entry alone fits in the limit, start with it
-        truncation_notice = "--- OLDER ENTRIES TRUNCATED ---\n\n"
+    most_recent_entry = entries[-1]
+    
+    # Format the most recent entry
+    recent_formatted = _format_entry(most_recent_entry)
+    
+    # If the most recent entry alone fits in the limit, start with it
+    truncation_notice = TRUNCATION_NOTICE + "\n\n"
+    
+    if len(recent_formatted) + len(truncation_notice) <= max_length:
+        # We can fit the most recent entry plus truncation notice. Entries are
+        # collected newest-first and reversed once at the end.
+        result_entries = [recent_formatted]
+        current_length = len(recent_formatted)
         
-        if len(recent_formatted) + len(truncation_notice) <= max_length:
-            # We can fit the most recent entry plus truncation notice
-            result_entries = [recent_formatted]
-            current_length = len(recent_formatted)
-            
-            # Try to add older entries working backwards (excluding the most recent we already added)
-            for entry in reversed(entries[:-1]):
-                if entry["timestamp"] == "Legacy":
-                    formatted_entry = entry["content"]
-                else:
-                    formatted_entry = f"\n\n--- CONTEXT ENTRY ({entry['timestamp']}) ---\n\n{entry['content']}"
-                
-                proposed_length = current_length + len(formatted_entry) + len(truncation_notice)
-                
-                if proposed_length <= max_length:
-                    result_entries.insert(0, formatted_entry)
-                    current_length += len(formatted_entry)
-                else:
-                    break
+        # Try to add older entries working backwards (excluding the most recent we already added)
+        for entry in reversed(entries[:-1]):
+            formatted_entry = _format_entry(entry)
             
-            # Add truncation notice if we have multiple entries
-            if len(result_entries) > 1 or len(entries) > 1:
-                result_entries.insert(0, truncation_notice.rstrip())
+            proposed_length = current_length + len(formatted_entry) + len(truncation_notice)
             
-            return "".join(result_entries)
-        else:
-            # Most recent entry is too long by itself, truncate it but keep it
-            available_space = max_length - len(truncation_notice) - 100  # Leave buffer
-            if available_space > 500:
-                # Truncate the recent content but preserve it
-                if most_recent_entry["timestamp"] == "Legacy":
-                    truncated_content = most_recent_entry["content"][:available_space] + "\n\n[CONTENT TRUNCATED]"
-                    return truncation_notice + truncated_content
-                else:
-                    truncated_content = most_recent_entry["content"][:available_space] + "\n\n[CONTENT TRUNCATED]"
-                    return truncation_notice + f"\n\n--- CONTEXT ENTRY ({most_recent_entry['timestamp']}) ---\n\n" + truncated_content
+            if proposed_length <= max_length:
+                result_entries.append(formatted_entry)
+                current_length += len(formatted_entry)
             else:
-                # Very little space, just return recent content without truncation notice
-                return recent_formatted[-max_length:]
-    
-    # Fallback: just return the end of the context
-    return context[-max_length:]
\ No newline at end of file
+                break
+        
+        # Add truncation notice if we have multiple entries; appended last, it
+        # comes first after the reverse
+        if len(result_entries) > 1 or len(entries) > 1:
+            result_entries.append(truncation_notice.rstrip())
+        
+        result_entries.reverse()
+        return "".join(result_entries)
+    else:
+        # Most recent entry is too long by itself, truncate it but keep it
+        available_space = max_length - len(truncation_notice) - 100  # Leave buffer
+        if available_space > 500:
+            # Truncate the recent content but preserve it
+            truncated_entry = {
+                "timestamp": most_recent_entry["timestamp"],
+                "content": most_recent_entry["content"][:available_space] + CONTENT_TRUNCATED_MARKER,
+            }
+            return truncation_notice + _format_entry(truncated_entry)
+        else:
+            # Very little space, just return recent content without truncation notice
+            return recent_formatted[-max_length:]
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Background executors that never hold up interpreter shutdown.
+
+concurrent.futures.ThreadPoolExecutor joins its worker threads when the
+interpreter exits, before atexit hooks run, so a pending Matrix/registry
+POST and its retries would keep the process alive. DaemonThreadPool has
+the same submit()/Future interface but runs tasks on daemon threads: work
+still queued or running when the process ends is simply abandoned.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class DaemonThreadPool:
+    """Bounded pool of daemon worker threads, started on demand."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "daemon-pool"):
+        """
+        Args:
+            max_workers: Maximum number of worker threads
+            thread_name_prefix: Prefix for worker thread names
+        """
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Schedule fn(*args, **kwargs) and return a Future for its result."""
+        future: Future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        self._adjust_thread_count()
+        return future
+
+    def _adjust_thread_count(self) -> None:
+        # An idle worker will pick the task up; otherwise grow up to max_workers
+        if self._idle.acquire(timeout=0):
+            return
+        with self._lock:
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"{self.thread_name_prefix}_{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self) -> None:
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            # Drop references before blocking so finished work can be collected
+            del future, fn, args, kwargs
+            self._idle.release()
@@ -0,0 +1,75 @@
+"""
+Shared HTTP session construction for outbound service calls.
+
+Sessions built here keep connections alive between requests and retry
+transient upstream failures with exponential backoff, so callers should
+create one per upstream service and reuse it instead of building a fresh
+session for every request.
+"""
+
+import requests
+from typing import Dict, Iterable, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import LETTA_API_HEADERS
+
+
+# Status codes that indicate a transient upstream failure worth retrying
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# (connect, read) timeout for Letta calls: fail fast on an unreachable host,
+# allow a little longer for the response itself
+LETTA_TIMEOUT = (3.05, 10)
+
+
+def build_session(
+    retries: int = 3,
+    backoff_factor: float = 1,
+    pool_maxsize: int = 10,
+    headers: Optional[Dict[str, str]] = None,
+    allowed_methods: Optional[Iterable[str]] = None,
+) -> requests.Session:
+    """
+    Build a requests.Session with connection pooling and retry/backoff.
+
+    Args:
+        retries: Total retry attempts for failed requests
+        backoff_factor: Exponential backoff factor between retries
+        pool_maxsize: Maximum pooled connections kept per host
+        headers: Default headers sent with every request on this session
+        allowed_methods: HTTP methods eligible for retry (defaults to urllib3's
+            idempotent set, which excludes POST and PATCH)
+
+    Returns:
+        A configured requests.Session
+    """
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=(
+            frozenset(allowed_methods) if allowed_methods is not None
+            else Retry.DEFAULT_ALLOWED_METHODS
+        )
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    if headers:
+        session.headers.update(headers)
+
+    return session
+
+
+# Shared session for all Letta API calls; LETTA_API_HEADERS are sent on every request.
+# Block PATCHes (value update, attach) are safe to repeat; POST creates a block, so it
+# is never retried to avoid duplicates.
+letta_session = build_session(
+    backoff_factor=0.25,
+    pool_maxsize=32,
+    headers=LETTA_API_HEADERS,
+    allowed_methods=("GET", "PATCH"),
+)
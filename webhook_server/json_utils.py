@@ -0,0 +1,34 @@
+"""
+JSON helpers backed by orjson.
+
+orjson parses response bodies and serializes payloads several times faster
+than the stdlib json module that requests uses. It is listed in both
+requirements files; when it is missing anyway, or a response has no raw
+byte body to decode, these helpers fall back to the standard library.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson installed
+    orjson = None
+
+
+def response_json(response) -> Any:
+    """Decode a requests response body, using orjson when available."""
+    content = getattr(response, "content", None)
+    if orjson is not None and isinstance(content, (bytes, bytearray)) and content:
+        return orjson.loads(content)
+    return response.json()
+
+
+def dumps_pretty(obj: Any) -> str:
+    """Serialize obj as 2-space indented JSON text (e.g. for logs), using orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass  # e.g. non-str keys, which only the stdlib encoder accepts
+    return json.dumps(obj, indent=2)
@@ -0,0 +1,54 @@
+"""
+Logging setup for the webhook server.
+
+Modules log through ``logging.getLogger(__name__)``; entry points call
+configure_logging() once at startup. The level comes from the LOG_LEVEL
+environment variable (default INFO), so verbose DEBUG output such as raw
+API payloads is only formatted when explicitly enabled.
+
+Request threads format each record (QueueHandler.prepare) and enqueue it;
+a QueueListener thread does the stream write, so webhook handlers never
+block on or contend for stdout/stderr.
+"""
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    """Stop the queue listener, flushing queued records; safe to call when not running."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(level: str | None = None) -> None:
+    """Configure root logging for the webhook server process (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener.start()
+    # Flush anything still queued when the process exits
+    atexit.register(_stop_listener)
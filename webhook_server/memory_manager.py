@@ -1,9 +1,29 @@
+import logging
 import requests
-from typing import Dict, Any, Optional
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
 
-from .config import LETTA_API_HEADERS, get_api_url
+from .config import get_api_url
+from .executors import DaemonThreadPool
+from .http_client import LETTA_TIMEOUT, letta_session
+from .json_utils import response_json
 from .context_utils import _build_cumulative_context
-from .block_finders import find_memory_block
+from .block_finders import (
+    find_memory_block,
+    invalidate_attached_blocks,
+    invalidate_global_blocks,
+)
+
+logger = logging.getLogger(__name__)
+
+# Per-(agent_id, label) write locks with the number of callers holding or waiting on
+# each; an entry is dropped once nobody uses it so the table stays small
+_write_locks: Dict[Tuple[Optional[str], str], list] = {}
+_write_locks_guard = threading.Lock()
+
+# Runs the attach PATCH for an existing, unattached block alongside its update PATCH
+_attach_pool = DaemonThreadPool(max_workers=4, thread_name_prefix="block-attach")
 
 def update_memory_block(block_id: str, block_data: Dict[str, Any], agent_id: Optional[str] = None, existing_block: Optional[dict] = None) -> Dict[str, Any]:
     """Update an existing memory block with new data using cumulative context."""
@@ -17,13 +37,18 @@ def update_memory_block(block_id: str, block_data: Dict[str, Any], agent_id: Opt
         "metadata": block_data.get("metadata", {})
     }
     
-    headers = LETTA_API_HEADERS.copy()
-        
+    # Skip the write when nothing would change (e.g. the new context was deduplicated)
+    if (existing_block
+            and cumulative_context == existing_context
+            and update_data["metadata"] == existing_block.get("metadata", {})):
+        logger.debug("Block %s unchanged, skipping update.", block_id)
+        return existing_block
+    
     update_url = get_api_url(f"blocks/{block_id}")
-    update_response = requests.patch(update_url, json=update_data, headers=headers)
+    update_response = letta_session.patch(update_url, json=update_data, timeout=LETTA_TIMEOUT)
     update_response.raise_for_status()
     
-    return update_response.json()
+    return response_json(update_response)
 
 def attach_block_to_agent(agent_id: str, block_id: str) -> bool:
     """Attach a block to an agent's core memory."""
@@ -32,61 +57,95 @@ def attach_block_to_agent(agent_id: str, block_id: str) -> bool:
         if isinstance(block_id, list):
             if len(block_id) > 0:
                 block_id = block_id[0]  # Take the first element
-                print(f"[attach_block_to_agent] Warning: block_id was passed as list, using first element: {block_id}")
+                logger.warning("block_id was passed as list, using first element: %s", block_id)
             else:
-                print(f"[attach_block_to_agent] Error: block_id was passed as empty list")
+                logger.error("block_id was passed as empty list")
                 return False
         
         # Ensure block_id is a string
         block_id = str(block_id)
         
         attach_url = get_api_url(f"agents/{agent_id}/core-memory/blocks/attach/{block_id}")
-        headers = LETTA_API_HEADERS.copy()
         
         # Send empty JSON body to avoid proxy error
-        attach_response = requests.patch(attach_url, headers=headers, json={})
+        attach_response = letta_session.patch(attach_url, json={}, timeout=LETTA_TIMEOUT)
         
         # Handle 409 Conflict (block already attached) as success
         if attach_response.status_code == 409:
-            print(f"[attach_block_to_agent] Block {block_id} already attached to agent {agent_id}")
+            logger.debug("Block %s already attached to agent %s", block_id, agent_id)
+            invalidate_attached_blocks(agent_id)
             return True
         
         attach_response.raise_for_status()
+        invalidate_attached_blocks(agent_id)
         
-        print(f"[attach_block_to_agent] Successfully attached block {block_id} to agent {agent_id}")
+        logger.info("Attached block %s to agent %s", block_id, agent_id)
         return True
         
     except requests.exceptions.RequestException as e:
-        print(f"[attach_block_to_agent] Failed to attach block {block_id} to agent {agent_id}: {e}")
+        logger.error("Failed to attach block %s to agent %s: %s", block_id, agent_id, e)
         return False
 
+@contextmanager
+def _block_write_lock(agent_id: Optional[str], block_label: str):
+    """Hold the write lock for one agent's block label for the duration of the block."""
+    key = (agent_id, block_label)
+    with _write_locks_guard:
+        entry = _write_locks.get(key)
+        if entry is None:
+            entry = _write_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _write_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _write_locks[key]
+
 def create_memory_block(block_data: Dict[str, Any], agent_id: Optional[str] = None) -> Dict[str, Any]:
-    """Create or update a memory block in Letta with auto-attachment."""
+    """
+    Create or update a memory block in Letta with auto-attachment.
+
+    Writes to the same agent and label are serialized, so a concurrent second
+    write finds the block the first one created or updated and builds its
+    cumulative context on top of it instead of overwriting it.
+    """
+    with _block_write_lock(agent_id, block_data.get("label", "graphiti_context")):
+        return _create_or_update_memory_block(block_data, agent_id)
+
+def _create_or_update_memory_block(block_data: Dict[str, Any], agent_id: Optional[str]) -> Dict[str, Any]:
+    """Find, attach and update the agent's block for this label, or create a new one."""
     block_label = block_data.get("label", "graphiti_context")
     
     if agent_id:
         block_to_use, is_attached = find_memory_block(agent_id, block_label)
         if block_to_use:
-            # If block exists but not attached, attach it
-            if not is_attached:
-                print(f"[create_memory_block] Block exists but not attached. Auto-attaching...")
-                attach_block_to_agent(agent_id, block_to_use['id'])
-            
-            # Update the existing block
-            return update_memory_block(block_to_use['id'], block_data, agent_id, block_to_use)
+            if is_attached:
+                # Update the existing block
+                return update_memory_block(block_to_use['id'], block_data, agent_id, block_to_use)
+
+            # Block exists but is not attached. Attach and update each only need the
+            # block id, so the attach PATCH runs alongside the update PATCH.
+            logger.info("Block %s exists but not attached to agent %s. Auto-attaching...", block_to_use['id'], agent_id)
+            attach_future = _attach_pool.submit(attach_block_to_agent, agent_id, block_to_use['id'])
+            updated_block = update_memory_block(block_to_use['id'], block_data, agent_id, block_to_use)
+            attach_future.result()
+            return updated_block
 
     # If no block is found or no agent_id, create a new one
     create_url = get_api_url("blocks")
-    headers = LETTA_API_HEADERS.copy()
 
-    create_response = requests.post(create_url, json=block_data, headers=headers)
+    create_response = letta_session.post(create_url, json=block_data, timeout=LETTA_TIMEOUT)
     create_response.raise_for_status()
     
-    new_block = create_response.json()
+    new_block = response_json(create_response)
+    invalidate_global_blocks(block_label)
     
     # Auto-attach the newly created block to the agent
     if agent_id and new_block.get('id'):
-        print(f"[create_memory_block] Auto-attaching newly created block {new_block['id']} to agent {agent_id}")
+        logger.info("Auto-attaching newly created block %s to agent %s", new_block['id'], agent_id)
         attach_block_to_agent(agent_id, new_block['id'])
     
     return new_block
@@ -6,12 +6,13 @@ Provides visibility into currently attached tools with categorization and contex
 """
 
 import os
-import requests
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, UTC
 from collections import defaultdict
 
-from .config import get_api_url, LETTA_API_HEADERS
+from .config import get_api_url
+from .http_client import LETTA_TIMEOUT, letta_session
+from .json_utils import response_json
 
 # Category mapping based on MCP server names
 CATEGORY_MAPPING = {
@@ -72,13 +73,13 @@ def get_agent_tools_with_details(agent_id: str) -> List[Dict]:
     try:
         # Use limit=500 to ensure we get all tools (API defaults to 10)
         url = get_api_url(f"agents/{agent_id}/tools?limit=500")
-        headers = {**LETTA_API_HEADERS, "user_id": agent_id}
         
         print(f"[TOOL_INVENTORY] Fetching tools for agent {agent_id}")
-        response = requests.get(url, headers=headers, timeout=10)
+        # The session already carries LETTA_API_HEADERS; only the per-agent delta is passed
+        response = letta_session.get(url, headers={"user_id": agent_id}, timeout=LETTA_TIMEOUT)
         response.raise_for_status()
         
-        tools = response.json()
+        tools = response_json(response)
         print(f"[TOOL_INVENTORY] Retrieved {len(tools)} tools")
         
         return tools if isinstance(tools, list) else []